@@ -1,225 +1,1142 @@
+import atexit
+import bisect
+import hashlib
 import json
 import os
 import logging
+import re
 import threading
 import time
-from datetime import datetime
-from functools import wraps
-import hashlib
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from functools import partial, wraps
 
-import requests
-from flask import Flask, render_template, redirect, url_for, request, session, flash, jsonify, send_from_directory
-from flask_babel import Babel, gettext as _
+import click
 
-from usosapi.usosapi import USOSAPISession, USOSAPIAuthorizationError
-from model import db, User, Challenge, Solve, Rating, Comment
+from flask import (
+    Flask, Blueprint, Response, render_template, redirect, url_for, request, session, flash, jsonify, abort,
+    g, has_request_context, current_app
+)
+from markupsafe import Markup, escape
+from flask_babel import Babel, gettext as _
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
+from werkzeug.local import LocalProxy
+
+from usosapi.usosapi import USOSAPISession, USOSAPIAuthorizationError, USOSAPIConnectionError
+from usosapi.token_store import MemoryTokenStore, SQLiteTokenStore
+from container_manager import (
+    ContainerManagerClient, ContainerManagerError, ContainerManagerBusyError, ContainerStatusHub, ContainerAdmission,
+    SQLiteContainerAdmission
+)
+from model import (
+    db, User, Challenge, Solve, Rating, Comment, AuditEvent, Setting,
+    init_database, get_database_uri, upgrade_database, MigrationError, upsert_solve, upsert_rating, upsert_comment
+)
+from flags import FlagEngine, LeakIndex
+from scoreboard import Scoreboard, ChallengeStatistics, RATING_VALUES
+from audit import AuditQueue
+from ratelimit import RateLimiter, RateLimitExceeded, TokenBucketStore, SQLiteBucketStore
+from pagecache import PageCache
+from shared import SQLiteSharedState, ChangeWatcher
+from metrics import MetricsRegistry, SlowRequestSampler
+from downloads import DownloadStore, OFFLOAD_MODES
+from compression import ResponseCompressor
+from sessions import ServerSessionInterface, MemorySessionStore, SQLiteSessionStore, UserCache
+from editions import (
+    CurrentEdition, EditionImportError, load_edition, import_edition, export_edition, EXPORT_KINDS, EXPORT_FORMATS,
+    EditionArchive, EditionArchiveError, archive_edition
+)
+from services import ServiceRegistry, BackgroundTasks
+from releases import ReleaseScheduler
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('EE_CTF_SECRET_KEY', os.urandom(24))
+SERVER_THREADS = int(os.environ.get('EE_CTF_SERVER_THREADS', 8))
+SHARED_STATE_PATH = os.environ.get('EE_CTF_SHARED_STATE')  # Defaults to the instance folder, set for several workers
+SHARED_STATE_POLL_INTERVAL = 1.0
+CHALLENGE_CHECK_INTERVAL = 30  # Seconds between looks for challenges edited straight in the database
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('EE_CTF_SLOW_REQUEST_THRESHOLD', 0))  # Seconds, 0 disables sampling
+SQL_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SESSION_TTL = 14 * 24 * 3600
+SESSION_MAX_COUNT = 100_000
+SESSION_STORE_PATH = os.environ.get('EE_CTF_SESSION_STORE', SHARED_STATE_PATH)  # Defaults to the instance folder
+SESSION_STORE_MEMORY = 'memory'  # Keeps sessions in the process, they are lost on restart
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 300  # Picks up profile changes written to the database directly
+SERVICES_EXTENSION = 'ee_ctf_services'
+TASKS_EXTENSION = 'ee_ctf_tasks'
+
+USOSAPI_CREDENTIALS_FILE = 'credentials/usos_api_credentials.json'
+USOSAPI_TOKEN_TTL = 1800
+USOSAPI_MAX_PENDING_TOKENS = 10_000
+USOSAPI_TOKEN_STORE_PATH = os.environ.get('EE_CTF_USOS_TOKEN_STORE', SHARED_STATE_PATH)
+
+CONTAINER_MANAGER_SECRET_FILE = 'credentials/container_manager_secret.json'
+CONTAINER_MANAGER_API = os.environ.get('EE_CTF_CONTAINER_MANAGER_API', 'http://127.0.0.1:5000')
+CONTAINER_MANAGER_DOMAIN = 'localhost'
+CONTAINER_MANAGER_POOL_SIZE = 16
+CONTAINER_MANAGER_MAX_CONCURRENCY = 6  # Leave waitress threads for other pages
+CONTAINER_STATUS_TTL = 10
+CONTAINER_STATUS_STREAM_LIFETIME = 60
+CONTAINER_STATUS_MAX_ENTRIES = 10_000
+CONTAINER_STATUS_MAX_IDLE = 300  # Seconds an unwatched status is kept after its last use
+CONTAINER_STATUS_MAX_STREAMS = max(1, SERVER_THREADS // 4)  # Every open stream holds a waitress thread
+# Container launches in flight across all workers, below CONTAINER_MANAGER_MAX_CONCURRENCY so other calls still fit
+CONTAINER_LAUNCHES_PER_IMAGE = 2
+CONTAINER_LAUNCHES_MAX = 4
+CONTAINER_LAUNCH_QUEUE_SIZE = 2000
+CONTAINER_LAUNCH_POLL_INTERVAL = 3  # Seconds between queue position updates on the page
+CONTAINER_LAUNCH_TIMEOUT = 300  # Seconds before a launch left by a dead worker gives its slot back
+CONTAINER_IMAGE_PATTERN = re.compile(r'/container_manager/manager/([\w.-]+)')  # Linked from challenge descriptions
+
+CURRENT_EDITION = os.environ.get('EE_CTF_CURRENT_EDITION')  # Overrides the edition stored in the database
+CURRENT_EDITION_SETTING = 'current_edition'
+CURRENT_EDITION_REFRESH_INTERVAL = 30
+ARCHIVE_DIRECTORY = os.environ.get('EE_CTF_ARCHIVE_DIR')  # Archived editions, defaults to the instance folder
+FLAG_NOISE_LENGTH = 12
+FLAG_NOISE_TAG = '<noise>'
+FLAG_DEFAULT_TEMPLATE = 'EE_CTF{<noise>}'
+FLAG_CACHE_SIZE = 50_000
+FLAG_MISSING_TTL = 30  # Seconds an unknown challenge id is answered without a database lookup
+TOP_SOLVERS_COUNT = 5
+AUDIT_QUEUE_SIZE = 20_000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0
+PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+STATISTICS_MARKER = '<!-- challenge-statistics -->'  # Filled in per request, so cached rows stay valid
+STATISTICS_COMMENTS_PAGE_SIZE = 50
+LEAKS_PAGE_SIZE = 50
+RELEASE_WARM_LEAD_TIME = 120  # Seconds before a challenge opens
+RELEASE_TIMELINE_REFRESH_INTERVAL = 300
+RELEASE_WARM_POOL = int(os.environ.get('EE_CTF_RELEASE_WARM_POOL', 0))  # Containers started ahead, 0 skips it
+DOWNLOAD_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'ctf_files')
+DOWNLOAD_MAX_AGE = 24 * 3600  # ETags are content hashes, so replaced files are picked up on revalidation
+DOWNLOAD_OFFLOAD = os.environ.get('EE_CTF_DOWNLOAD_OFFLOAD')  # Let the front proxy send files, see OFFLOAD_MODES
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('EE_CTF_DOWNLOAD_ACCEL_PREFIX', '/protected/ctf_files/')
+DOWNLOAD_COMPRESSED_DIR = os.environ.get('EE_CTF_DOWNLOAD_COMPRESSED_DIR')
+STATIC_COMPRESSED_DIR = os.environ.get('EE_CTF_STATIC_COMPRESSED_DIR')  # Defaults to the instance folder
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # Fingerprinted URLs change with the content
+STATIC_FINGERPRINT_LENGTH = 16
+COMPRESSION_MIN_SIZE = 1024
+
+if DOWNLOAD_OFFLOAD is not None and DOWNLOAD_OFFLOAD not in OFFLOAD_MODES:
+    raise ValueError(f"EE_CTF_DOWNLOAD_OFFLOAD must be one of {', '.join(OFFLOAD_MODES)}")
+
+ADMIN_IDS = frozenset({'1178835', '1187538'})
+
+# (requests, per seconds) for each key scope
+RATE_LIMITS = {
+    'submit_flag': {'user': (10, 60), 'ip': (60, 60)},
+    'submit_rating': {'user': (20, 60)},
+    'submit_comment': {'user': (10, 60)},
+    'container_status': {'user': (60, 60)},
+    'container_action': {'user': (10, 60), 'ip': (60, 60)},
+    'usos_auth': {'ip': (20, 60)},
+}
+
+# Built first, so the state loaded after it already includes the events it skips
+WARMUP_SERVICES = (
+    'shared_state', 'session_store', 'current_edition', 'flag_engine', 'scoreboard', 'challenge_statistics',
+    'leak_index', 'user_cache', 'page_cache', 'usosapi', 'container_admission'
+)
+
+babel = Babel()
+ctf = Blueprint('ctf', __name__, cli_group=None)
+
+# Process-wide, so every app in the process reports into the same registry
+metrics = MetricsRegistry()
+request_latency = metrics.histogram(
+    'ee_ctf_request_duration_seconds', 'Time spent handling a request', ('endpoint',)
+)
+request_responses = metrics.counter(
+    'ee_ctf_responses_total', 'Responses by endpoint and status code', ('endpoint', 'status')
+)
+request_sql_queries = metrics.histogram(
+    'ee_ctf_request_sql_queries', 'SQL queries executed by a request', ('endpoint',), buckets=SQL_QUERY_BUCKETS
+)
+request_sql_time = metrics.histogram(
+    'ee_ctf_request_sql_duration_seconds', 'Time a request spent executing SQL', ('endpoint',)
+)
+upstream_latency = metrics.histogram(
+    'ee_ctf_upstream_duration_seconds', 'Calls to USOS and the container manager', ('service', 'operation')
+)
+upstream_errors = metrics.counter(
+    'ee_ctf_upstream_errors_total', 'Failed calls to USOS and the container manager', ('service', 'operation')
+)
+
+
+def upstream_observer(service):
+    def observe(operation, seconds, failed):
+        upstream_latency.observe(seconds, service, operation)
+        if failed:
+            upstream_errors.inc(service, operation)
+    return observe
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started_at'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_started_at', time.perf_counter())
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_time += elapsed
+
+
+def get_service(name):
+    return current_app.extensions[SERVICES_EXTENSION].get(name)
+
+
+def service_loaded(name):
+    services = current_app.extensions.get(SERVICES_EXTENSION)
+    return services is not None and services.loaded(name)
+
+
+def service(name):
+    # Resolved on every use, so each app gets its own instance, built the first time it is needed
+    return LocalProxy(partial(get_service, name))
+
+
+session_store = service('session_store')
+usosapi_token_store = service('usosapi_token_store')
+usosapi = service('usosapi')
+container_manager_client = service('container_manager_client')
+container_status_hub = service('container_status_hub')
+container_admission = service('container_admission')
+current_edition = service('current_edition')
+flag_engine = service('flag_engine')
+leak_index = service('leak_index')
+scoreboard = service('scoreboard')
+challenge_statistics = service('challenge_statistics')
+user_cache = service('user_cache')
+page_cache = service('page_cache')
+download_store = service('download_store')
+static_store = service('static_store')
+response_compressor = service('response_compressor')
+shared_state = service('shared_state')
+challenge_watcher = service('challenge_watcher')
+rate_limit_store = service('rate_limit_store')
+release_scheduler = service('release_scheduler')
+edition_archive = service('edition_archive')
+audit_queue = service('audit_queue')
+slow_request_sampler = service('slow_request_sampler')
+
+rate_limiter = RateLimiter(
+    rate_limit_store,
+    RATE_LIMITS,
+    user_id_getter=lambda: session.get('user_id'),
+    ip_getter=lambda: request.remote_addr
+)
+
+
+def load_user_profile(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+
+    return {
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'photo_url': user.photo_url,
+        'is_admin': user.id in ADMIN_IDS,
+    }
+
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['BABEL_DEFAULT_LOCALE'] = 'pl'
-app.config['BABEL_SUPPORTED_LOCALES'] = ['en', 'pl']
+def load_current_edition():
+    if CURRENT_EDITION is not None:
+        return int(CURRENT_EDITION)
 
-babel = Babel(app)
-db.init_app(app)
+    value = db.session.query(Setting.value).filter_by(name=CURRENT_EDITION_SETTING).scalar()
+    if value is not None:
+        return int(value)
+
+    # Without a setting the newest edition is the current one
+    return db.session.query(func.max(Challenge.edition_number)).scalar() or 1
+
+
+def load_challenges_fingerprint():
+    # Covers every column the caches keep, so a flag or description fixed by hand is noticed too
+    digest = hashlib.sha256()
+    for row in db.session.query(Challenge.__table__).order_by(Challenge.id):
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()
+
+
+def load_flag_template(challenge_id):
+    return db.session.query(Challenge.flag).filter_by(id=challenge_id).scalar()
+
+
+def create_session_store():
+    # Stored in SQLite by default, so logins survive a restart
+    path = current_app.config['SESSION_STORE_PATH']
+    if path == SESSION_STORE_MEMORY:
+        return MemorySessionStore(ttl=SESSION_TTL, max_size=SESSION_MAX_COUNT)
+    if not path:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        path = os.path.join(current_app.instance_path, 'sessions.db')
+    return SQLiteSessionStore(path, ttl=SESSION_TTL, max_size=SESSION_MAX_COUNT)
+
+
+def create_usosapi_token_store():
+    path = current_app.config['USOSAPI_TOKEN_STORE_PATH']
+    if path:
+        return SQLiteTokenStore(path, ttl=USOSAPI_TOKEN_TTL, max_size=USOSAPI_MAX_PENDING_TOKENS)
+    return MemoryTokenStore(ttl=USOSAPI_TOKEN_TTL, max_size=USOSAPI_MAX_PENDING_TOKENS)
+
+
+def create_usosapi():
+    with open(current_app.config['USOSAPI_CREDENTIALS_FILE'], 'r') as file:
+        usosapi_credentials = json.load(file)
+
+    return USOSAPISession(
+        usosapi_credentials['api_base_address'],
+        usosapi_credentials['consumer_key'],
+        usosapi_credentials['consumer_secret'],
+        'email',
+        token_store=get_service('usosapi_token_store'),
+        observer=upstream_observer('usos')
+    )
+
+
+def create_container_manager_client():
+    with open(current_app.config['CONTAINER_MANAGER_SECRET_FILE']) as f:
+        secret_data = json.load(f)
+
+    return ContainerManagerClient(
+        current_app.config['CONTAINER_MANAGER_API'],
+        secret_data['secret'],
+        pool_size=CONTAINER_MANAGER_POOL_SIZE,
+        max_concurrency=CONTAINER_MANAGER_MAX_CONCURRENCY,
+        observer=upstream_observer('container_manager')
+    )
+
+
+def create_container_status_hub():
+    return ContainerStatusHub(
+        get_service('container_manager_client').container_status,
+        ttl=CONTAINER_STATUS_TTL,
+        max_streams=CONTAINER_STATUS_MAX_STREAMS,
+        max_entries=CONTAINER_STATUS_MAX_ENTRIES,
+        max_idle=CONTAINER_STATUS_MAX_IDLE
+    )
+
+
+def create_container_admission():
+    options = {
+        'per_image': CONTAINER_LAUNCHES_PER_IMAGE,
+        'max_in_flight': CONTAINER_LAUNCHES_MAX,
+        'max_queued': CONTAINER_LAUNCH_QUEUE_SIZE,
+        'on_finished': get_service('container_status_hub').invalidate,
+    }
+    launch = get_service('container_manager_client').make_container
+
+    # With several workers the queue and the slots are shared, so the limits hold for all of them together
+    path = current_app.config['SHARED_STATE_PATH']
+    if path:
+        return SQLiteContainerAdmission(path, launch, launch_timeout=CONTAINER_LAUNCH_TIMEOUT, **options)
+    return ContainerAdmission(launch, **options)
+
+
+def create_current_edition():
+    edition = CurrentEdition(
+        load_current_edition,
+        refresh_interval=CURRENT_EDITION_REFRESH_INTERVAL,
+        on_change=on_edition_changed
+    )
+    edition.refresh()
+    return edition
+
+
+def create_flag_engine():
+    engine = FlagEngine(
+        load_flag_template,
+        FLAG_DEFAULT_TEMPLATE,
+        FLAG_NOISE_TAG,
+        FLAG_NOISE_LENGTH,
+        cache_size=FLAG_CACHE_SIZE,
+        missing_ttl=FLAG_MISSING_TTL
+    )
+    engine.load(
+        db.session.query(Challenge.id, Challenge.flag).filter_by(edition_number=current_edition.get()).all()
+    )
+    return engine
 
-with app.app_context():
-    db.create_all()
 
-with open('credentials/usos_api_credentials.json', 'r') as file:
-    usosapi_credentials = json.load(file)
+def create_leak_index():
+    index = LeakIndex(get_service('flag_engine').noise, FLAG_NOISE_TAG, FLAG_NOISE_LENGTH)
+    rebuild_leak_index(index)
+    return index
 
-usosapi = USOSAPISession(
-    usosapi_credentials['api_base_address'],
-    usosapi_credentials['consumer_key'],
-    usosapi_credentials['consumer_secret'],
-    'email'
+
+def create_scoreboard():
+    board = Scoreboard(top_size=TOP_SOLVERS_COUNT)
+    board.rebuild(
+        db.session.query(Challenge.id, Challenge.edition_number).all(),
+        db.session.query(User.id, User.first_name, User.last_name).all(),
+        db.session.query(Solve.id, Solve.user_id, Solve.challenge_id, Solve.solve_time).all()
+    )
+    return board
+
+
+def create_challenge_statistics():
+    statistics = ChallengeStatistics()
+    statistics.rebuild(
+        db.session.query(Challenge.id, Challenge.edition_number, Challenge.start_date).all(),
+        db.session.query(Solve.user_id, Solve.challenge_id, Solve.solve_time).all(),
+        db.session.query(Rating.user_id, Rating.challenge_id, Rating.rating).all(),
+        db.session.query(Comment.user_id, Comment.challenge_id).all()
+    )
+    return statistics
+
+
+def create_static_store():
+    compressed_dir = STATIC_COMPRESSED_DIR or os.path.join(current_app.instance_path, 'static_compressed')
+    return DownloadStore(current_app.static_folder, compressed_dir=compressed_dir)
+
+
+def create_shared_state():
+    # Always in SQLite, so changes made from the CLI reach a running server without a restart
+    path = current_app.config['SHARED_STATE_PATH']
+    if not path:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        path = os.path.join(current_app.instance_path, 'shared_state.db')
+    return SQLiteSharedState(path, poll_interval=SHARED_STATE_POLL_INTERVAL)
+
+
+def create_rate_limit_store():
+    path = current_app.config['SHARED_STATE_PATH']
+    if path:
+        return SQLiteBucketStore(path)
+    return TokenBucketStore()
+
+
+def create_release_scheduler():
+    return ReleaseScheduler(
+        current_app._get_current_object(),
+        load_release_timeline,
+        warm_release,
+        lead_time=RELEASE_WARM_LEAD_TIME,
+        refresh_interval=RELEASE_TIMELINE_REFRESH_INTERVAL
+    )
+
+
+def get_archive_directory():
+    return current_app.config['ARCHIVE_DIRECTORY'] or os.path.join(current_app.instance_path, 'archive')
+
+
+def create_edition_archive():
+    archive = EditionArchive(get_archive_directory(), top_size=TOP_SOLVERS_COUNT)
+    archive.refresh()
+    return archive
+
+
+def create_audit_queue():
+    return AuditQueue(
+        current_app._get_current_object(),
+        db,
+        AuditEvent,
+        max_size=AUDIT_QUEUE_SIZE,
+        batch_size=AUDIT_BATCH_SIZE,
+        flush_interval=AUDIT_FLUSH_INTERVAL
+    )
+
+
+SERVICE_FACTORIES = {
+    'session_store': create_session_store,
+    'usosapi_token_store': create_usosapi_token_store,
+    'usosapi': create_usosapi,
+    'container_manager_client': create_container_manager_client,
+    'container_status_hub': create_container_status_hub,
+    'container_admission': create_container_admission,
+    'current_edition': create_current_edition,
+    'flag_engine': create_flag_engine,
+    'leak_index': create_leak_index,
+    'scoreboard': create_scoreboard,
+    'challenge_statistics': create_challenge_statistics,
+    'user_cache': lambda: UserCache(load_user_profile, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL),
+    'page_cache': lambda: PageCache(max_bytes=PAGE_CACHE_MAX_BYTES),
+    'download_store': lambda: DownloadStore(DOWNLOAD_DIRECTORY, compressed_dir=DOWNLOAD_COMPRESSED_DIR),
+    'static_store': create_static_store,
+    'response_compressor': lambda: ResponseCompressor(min_size=COMPRESSION_MIN_SIZE),
+    'shared_state': create_shared_state,
+    'challenge_watcher': lambda: ChangeWatcher(load_challenges_fingerprint, interval=CHALLENGE_CHECK_INTERVAL),
+    'rate_limit_store': create_rate_limit_store,
+    'release_scheduler': create_release_scheduler,
+    'edition_archive': create_edition_archive,
+    'audit_queue': create_audit_queue,
+    'slow_request_sampler': lambda: SlowRequestSampler(threshold=SLOW_REQUEST_THRESHOLD),
+}
+
+
+CACHE_SERVICES = {
+    'page': 'page_cache',
+    'flag': 'flag_engine',
+    'container_status': 'container_status_hub',
+    'user': 'user_cache',
+}
+
+
+def cache_stats():
+    return {
+        name: get_service(service_name).stats()
+        for name, service_name in CACHE_SERVICES.items()
+        if service_loaded(service_name)
+    }
+
+
+def usos_token_evictions():
+    stats = usosapi_token_store.stats()
+    return [(('capacity',), stats['evictions']), (('expired',), stats['expirations'])]
+
+
+def if_loaded(service_name, collect):
+    # A scrape never builds a service, one nobody has used yet has nothing to report
+    return lambda: collect() if service_loaded(service_name) else []
+
+
+metrics.collector(
+    'ee_ctf_cache_hits_total', 'counter', 'Lookups answered from an in-memory cache', ('cache',),
+    lambda: (((name,), stats['hits']) for name, stats in cache_stats().items())
+)
+metrics.collector(
+    'ee_ctf_cache_misses_total', 'counter', 'Lookups missing an in-memory cache', ('cache',),
+    lambda: (((name,), stats['misses']) for name, stats in cache_stats().items())
+)
+metrics.collector(
+    'ee_ctf_cache_entries', 'gauge', 'Entries held by an in-memory cache', ('cache',),
+    lambda: (((name,), stats['entries']) for name, stats in cache_stats().items())
+)
+metrics.collector(
+    'ee_ctf_container_status_streams', 'gauge', 'Open container status event streams', (),
+    if_loaded('container_status_hub', lambda: [((), container_status_hub.stats()['streams'])])
+)
+metrics.collector(
+    'ee_ctf_sessions', 'gauge', 'Server-side sessions', (),
+    if_loaded('session_store', lambda: [((), session_store.stats()['size'])])
+)
+metrics.collector(
+    'ee_ctf_container_launches', 'gauge', 'Container launches waiting in the queue or in flight', ('state',),
+    if_loaded('container_admission', lambda: (
+        ((state,), container_admission.stats()[state]) for state in ('queued', 'in_flight')
+    ))
+)
+metrics.collector(
+    'ee_ctf_leaked_flag_submissions_total', 'counter', "Wrong submissions matching another player's flag", (),
+    if_loaded('leak_index', lambda: [((), leak_index.stats()['hits'])])
+)
+metrics.collector(
+    'ee_ctf_usos_pending_tokens', 'gauge', 'USOS request tokens waiting for a login callback', (),
+    if_loaded('usosapi_token_store', lambda: [((), usosapi_token_store.stats()['size'])])
+)
+metrics.collector(
+    'ee_ctf_usos_token_evictions_total', 'counter', 'USOS request tokens dropped before their login callback',
+    ('reason',), if_loaded('usosapi_token_store', usos_token_evictions)
+)
+metrics.collector(
+    'ee_ctf_audit_events_total', 'counter', 'Audit events by outcome', ('state',),
+    if_loaded('audit_queue', lambda: (((state,), count) for state, count in dict(audit_queue.stats).items()))
+)
+metrics.collector(
+    'ee_ctf_compressed_bytes_total', 'counter', 'Response bytes before and after compression', ('stage',),
+    if_loaded('response_compressor', lambda: [
+        (('in',), response_compressor.stats['bytes_in']),
+        (('out',), response_compressor.stats['bytes_out'])
+    ])
+)
+metrics.collector(
+    'ee_ctf_download_files', 'gauge', 'Downloadable files with a known content hash', (),
+    if_loaded('download_store', lambda: [((), download_store.stats()['files'])])
+)
+metrics.collector(
+    'ee_ctf_audit_queue_size', 'gauge', 'Audit events waiting to be written', (),
+    if_loaded('audit_queue', lambda: [((), audit_queue.queue.qsize())])
+)
+metrics.collector(
+    'ee_ctf_service_load_seconds', 'gauge', 'Time it took to build a service on first use', ('service',),
+    lambda: (((name,), seconds)
+             for name, seconds in current_app.extensions[SERVICES_EXTENSION].stats()['load_times'].items())
 )
 
-with open('credentials/container_manager_secret.json') as f:
-    secret_data = json.load(f)
-    SECRET_KEY = secret_data['secret']
 
-CONTAINER_MANAGER_API = 'http://127.0.0.1:5000'
-CONTAINER_MANAGER_DOMAIN = 'localhost'
-USOSAPI_SESSION_CHECK = 43_200  # Every 12 hours
+def load_challenges():
+    flag_engine.load(
+        db.session.query(Challenge.id, Challenge.flag).filter_by(edition_number=current_edition.get()).all()
+    )
+    query = db.session.query(Challenge.id, Challenge.edition_number, Challenge.start_date)
+    for challenge_id, edition_number, start_date in query:
+        scoreboard.add_challenge(challenge_id, edition_number)
+        challenge_statistics.add_challenge(challenge_id, edition_number, start_date)
 
-CURRENT_EDITION_NUM = 2
-FLAG_NOISE_LENGTH = 12
-FLAG_NOISE_TAG = '<noise>'
-FLAG_DEFAULT_TEMPLATE = 'EE_CTF{<noise>}'
 
-ADMIN_IDS = ['1178835', '1187538']
+def load_new_solves():
+    solves = (db.session.query(Solve.id, Solve.user_id, Solve.challenge_id, Solve.solve_time)
+              .filter(Solve.id > scoreboard.last_solve_id)
+              .order_by(Solve.id)
+              .all())
+
+    new_user_ids = {user_id for _id, user_id, _ch_id, _time in solves if not scoreboard.has_user(user_id)}
+    if new_user_ids:
+        users = db.session.query(User.id, User.first_name, User.last_name).filter(User.id.in_(new_user_ids))
+        for user_id, first_name, last_name in users:
+            scoreboard.add_user(user_id, first_name, last_name)
+
+    for solve_id, user_id, challenge_id, solve_time in solves:
+        scoreboard.record_solve(user_id, challenge_id, solve_time, solve_id)
+        challenge_statistics.record_solve(user_id, challenge_id, solve_time)
+
+
+def reload_challenges():
+    flag_engine.clear()
+    page_cache.clear()
+    # A switched edition rebuilds the leak index on its own
+    previous_edition = current_edition.value
+    if current_edition.refresh() == previous_edition and service_loaded('leak_index'):
+        rebuild_leak_index(leak_index)
+    load_challenges()
+    if service_loaded('release_scheduler'):
+        release_scheduler.reload()
+    if service_loaded('challenge_watcher'):
+        challenge_watcher.reset()
+
+
+def reload_settings():
+    current_edition.refresh()
+
+
+def apply_user_events():
+    for changed in shared_state.events('users'):
+        user_cache.invalidate(changed['user_id'])
+        scoreboard.add_user(changed['user_id'], changed['first_name'], changed['last_name'])
+        leak_index.add_user(changed['user_id'])
+
+
+def rebuild_leak_index(index):
+    # Only the current edition is indexed, the hashing runs in the background
+    challenges = db.session.query(Challenge.id, Challenge.flag).filter_by(edition_number=current_edition.get()).all()
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    threading.Thread(target=index.rebuild, args=(challenges, user_ids), name='leak-index', daemon=True).start()
+
+
+def on_edition_changed(edition_number):
+    # Services built later start from the new edition anyway
+    if service_loaded('leak_index'):
+        rebuild_leak_index(leak_index)
+    if service_loaded('release_scheduler'):
+        release_scheduler.reload()
+
+
+def reload_archives():
+    # Newly archived editions are read from their files, the live copies would only mix old data into current pages
+    if service_loaded('edition_archive'):
+        added = edition_archive.refresh()
+    else:
+        added = edition_archive.edition_numbers()  # Built just now, with every archive there is
+    for edition_number in added:
+        if service_loaded('scoreboard'):
+            scoreboard.remove_edition(edition_number)
+        if service_loaded('challenge_statistics'):
+            challenge_statistics.remove_edition(edition_number)
+    page_cache.clear()
+
+
+def apply_feedback_events():
+    for feedback in shared_state.events('feedback'):
+        if feedback['kind'] == 'rating':
+            challenge_statistics.record_rating(feedback['user_id'], feedback['challenge_id'], feedback['rating'])
+        else:
+            challenge_statistics.record_comment(feedback['user_id'], feedback['challenge_id'])
+
+
+# Applied in this order, so solves and feedback never refer to a challenge we have not loaded yet,
+# and an archived edition is readable before its challenges are gone from the live database
+SHARED_STATE_HANDLERS = {
+    'archives': reload_archives,
+    'challenges': reload_challenges,
+    'solves': load_new_solves,
+    'feedback': apply_feedback_events,
+    'users': apply_user_events,
+    'settings': reload_settings,
+}
+
+
+def start_request_metrics():
+    g.request_started_at = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    if SLOW_REQUEST_THRESHOLD:
+        slow_request_sampler.begin(request.endpoint)
+
+
+def record_request_metrics(response):
+    if 'request_started_at' in g:
+        endpoint = request.endpoint or 'unmatched'
+        request_latency.observe(time.perf_counter() - g.request_started_at, endpoint)
+        request_responses.inc(endpoint, response.status_code)
+        request_sql_queries.observe(g.sql_queries, endpoint)
+        request_sql_time.observe(g.sql_time, endpoint)
+    return response
+
+
+def compress_response(response):
+    return response_compressor.compress(response)
+
+
+def add_static_fingerprint(endpoint, values):
+    if endpoint == 'static' and 'v' not in values:
+        stored = static_store.lookup(values['filename'])
+        if stored is not None:
+            values['v'] = stored.etag[:STATIC_FINGERPRINT_LENGTH]
+
+
+def serve_static(filename):
+    # Only the current fingerprint may be cached forever, stale or missing ones are revalidated
+    stored = static_store.lookup(filename)
+    fingerprinted = stored is not None and request.args.get('v') == stored.etag[:STATIC_FINGERPRINT_LENGTH]
+    return static_store.send(
+        filename,
+        max_age=STATIC_IMMUTABLE_MAX_AGE if fingerprinted else None,
+        immutable=fingerprinted
+    )
+
+
+def end_request_sampling(exception):
+    if SLOW_REQUEST_THRESHOLD:
+        slow_request_sampler.end()
+
+
+def sync_shared_state():
+    changes = shared_state.changes()
+    if challenge_watcher.changed():
+        changes.add('challenges')
+    for name, handler in SHARED_STATE_HANDLERS.items():
+        if name in changes:
+            handler()
+
+
+@event.listens_for(Challenge, 'after_insert')
+@event.listens_for(Challenge, 'after_update')
+@event.listens_for(Challenge, 'after_delete')
+def on_challenge_changed(mapper, connection, target):
+    # Services nobody has used yet read the change from the database once they are built
+    if service_loaded('flag_engine'):
+        flag_engine.invalidate(target.id)
+    if service_loaded('page_cache'):
+        page_cache.clear()
+    if current_app.extensions.get(SERVICES_EXTENSION) is not None:
+        Session.object_session(target).info['challenges_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def on_session_commit(db_session):
+    if db_session.info.pop('challenges_changed', False):
+        shared_state.bump('challenges')
+
+
+@event.listens_for(Challenge, 'after_insert')
+@event.listens_for(Challenge, 'after_update')
+def on_challenge_saved(mapper, connection, target):
+    if service_loaded('scoreboard'):
+        scoreboard.add_challenge(target.id, target.edition_number)
+    if service_loaded('challenge_statistics'):
+        challenge_statistics.add_challenge(target.id, target.edition_number, target.start_date)
+    if service_loaded('leak_index'):
+        if target.edition_number == current_edition.value or leak_index.is_indexed(target.id):
+            leak_index.set_challenge(target.id, target.flag)
+
+
+@ctf.cli.command('upgrade-db')
+def upgrade_db_command():
+    try:
+        upgrade_database(db.engine)
+    except MigrationError as e:
+        raise click.ClickException(e.message)
+
+
+@ctf.cli.command('import-edition')
+@click.argument('edition_number', type=int)
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+def import_edition_command(edition_number, directory):
+    try:
+        challenges = load_edition(directory)
+    except EditionImportError as e:
+        raise click.ClickException(e.message)
+
+    created, updated = import_edition(edition_number, challenges)
+    logging.info(f"Imported edition {edition_number}: {created} challenges created, {updated} updated")
+
+
+@ctf.cli.command('export-edition')
+@click.argument('edition_number', type=int)
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+def export_edition_command(edition_number, kind, export_format, output):
+    with edition_session(edition_number) as source:
+        count = export_edition(kind, edition_number, output, export_format, session=source)
+    logging.info(f"Exported {count} {kind} of edition {edition_number}")
+
+
+@ctf.cli.command('archive-edition')
+@click.argument('edition_number', type=int)
+@click.option('--vacuum', is_flag=True, help='Reclaim the freed space, SQLite locks the database meanwhile')
+def archive_edition_command(edition_number, vacuum):
+    if edition_number == load_current_edition():
+        raise click.ClickException(f"Edition {edition_number} is the current edition, switch to another one first")
+
+    try:
+        counts = archive_edition(edition_number, get_archive_directory())
+    except EditionArchiveError as e:
+        raise click.ClickException(e.message)
+
+    shared_state.bump('archives')
+    shared_state.bump('challenges')
+    summary = ", ".join(f"{count} {table}s" for table, count in counts.items())
+    logging.info(f"Archived edition {edition_number}: {summary}")
+
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('VACUUM')
+
+
+@ctf.cli.command('set-current-edition')
+@click.argument('edition_number', type=int)
+def set_current_edition_command(edition_number):
+    db.session.merge(Setting(name=CURRENT_EDITION_SETTING, value=str(edition_number)))
+    db.session.commit()
+    shared_state.bump('settings')
+    logging.info(f"Current edition set to {edition_number}")
+
+    if CURRENT_EDITION is not None:
+        logging.warning(f"EE_CTF_CURRENT_EDITION={CURRENT_EDITION} still overrides the setting")
 
 
 @babel.localeselector
 def get_locale():
-    locale = session.get('lang', app.config['BABEL_DEFAULT_LOCALE'])
+    locale = session.get('lang', current_app.config['BABEL_DEFAULT_LOCALE'])
 
-    if locale not in app.config['BABEL_SUPPORTED_LOCALES']:
-        return app.config['BABEL_DEFAULT_LOCALE']
+    if locale not in current_app.config['BABEL_SUPPORTED_LOCALES']:
+        return current_app.config['BABEL_DEFAULT_LOCALE']
 
     return locale
 
 
-@app.context_processor
+def rate_limit_exceeded(e):
+    message = _("Too many requests. Please try again in %(seconds)s s.", seconds=e.retry_after)
+    headers = {'Retry-After': str(e.retry_after)}
+
+    if request.path.startswith('/container_manager/') or request.is_json:
+        return jsonify({'error': message}), 429, headers
+
+    return render_template('too_many_requests.html', message=message), 429, headers
+
+
+def current_user():
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = user_cache.get(user_id) if user_id is not None else None
+
+    return g.current_user
+
+
 def inject_conf_var():
-    return dict(get_locale=get_locale)
+    return dict(get_locale=get_locale, current_user=current_user())
 
 
 def is_admin():
-    if 'logged_in' in session and session['user']['id'] in ADMIN_IDS:
-        return True
-    return False
+    return session.get('user_id') in ADMIN_IDS
 
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'logged_in' not in session:
+        if current_user() is None:
             flash(_("Please log in to access this page."), "danger")
-            return redirect(url_for('login'))
+            return redirect(url_for('ctf.login'))
         return f(*args, **kwargs)
     return decorated_function
 
 
-@app.route('/change_language/<language>')
+@ctf.route('/change_language/<language>')
 def change_language(language):
-    if language in app.config['BABEL_SUPPORTED_LOCALES']:
+    if language in current_app.config['BABEL_SUPPORTED_LOCALES']:
         session['lang'] = language
     else:
-        session['lang'] = app.config['BABEL_DEFAULT_LOCALE']
+        session['lang'] = current_app.config['BABEL_DEFAULT_LOCALE']
         flash(_("Language not supported."), "danger")
 
     referrer = request.referrer
     if referrer and referrer != request.url:
         return redirect(referrer)
     else:
-        return redirect(url_for('home'))
+        return redirect(url_for('ctf.home'))
+
+
+@contextmanager
+def edition_session(edition_number):
+    # Archived editions are read from their own file, everything else from the live database
+    archived = edition_archive.get(edition_number)
+    if archived is None:
+        yield db.session
+    else:
+        with archived.session() as archive_session:
+            yield archive_session
+
+
+def edition_scoreboard(edition_number):
+    archived = edition_archive.get(edition_number)
+    return archived.scoreboard() if archived is not None else scoreboard
 
 
-@app.route('/')
+def edition_statistics(edition_number):
+    archived = edition_archive.get(edition_number)
+    return archived.statistics() if archived is not None else challenge_statistics
+
+
+def get_release_timeline(edition_number):
+    key = ('timeline', edition_number)
+    timeline = page_cache.get(key)
+    if timeline is None:
+        query = db.session.query(Challenge.start_date).filter_by(edition_number=edition_number)
+        timeline = [start_date for (start_date,) in query.order_by(Challenge.start_date)]
+        page_cache.set(key, timeline, size=64 * (len(timeline) + 1))
+
+    return timeline
+
+
+def get_challenge_grid_rows(edition_number, locale, admin, now=None):
+    # Rendering as of a later time lets a release be prepared before it happens
+    now = now or datetime.now()
+    timeline = get_release_timeline(edition_number)
+    epoch = bisect.bisect_right(timeline, now)
+
+    key = ('grid', edition_number, locale, admin, epoch)
+    rows = page_cache.get(key)
+    if rows is None:
+        challenges = Challenge.query.filter_by(edition_number=edition_number).order_by(Challenge.number).all()
+        rows = [
+            (
+                chg.id,
+                render_template('challenge_row.html', challenge=chg, solved=False, is_admin=admin, now=now),
+                render_template('challenge_row.html', challenge=chg, solved=True, is_admin=admin, now=now)
+            )
+            for chg in challenges
+        ]
+        expires_at = timeline[epoch] if epoch < len(timeline) else None
+        page_cache.set(key, rows, size=sum(len(row) + len(solved_row) for _id, row, solved_row in rows),
+                       expires_at=expires_at)
+
+    return rows
+
+
+def get_challenge_view(edition_number, challenge_number, locale):
+    key = ('challenge', edition_number, challenge_number, locale)
+    view = page_cache.get(key)
+    if view is None:
+        with edition_session(edition_number) as source:
+            challenge = (source.query(Challenge)
+                         .filter_by(edition_number=edition_number, number=challenge_number)
+                         .first())
+        if challenge is None:
+            abort(404)
+        view = {
+            'id': challenge.id,
+            'start_date': challenge.start_date,
+            'name': challenge.name_pl if locale == 'pl' else challenge.name,
+            'description': challenge.description_pl if locale == 'pl' else challenge.description,
+        }
+        page_cache.set(key, view, size=len(view['name']) + len(view['description']) + 128)
+
+    return view
+
+
+def load_release_timeline():
+    return (db.session.query(Challenge.id, Challenge.number, Challenge.start_date)
+            .filter_by(edition_number=current_edition.get())
+            .all())
+
+
+def warm_release(challenge_id, start_date):
+    # Renders what the first players will ask for, as it will look once the challenge is out
+    challenge = db.session.get(Challenge, challenge_id)
+    if challenge is None:
+        return {'pages': 0}
+
+    flag_engine.get_template(challenge_id)
+    pages = 0
+    for locale in current_app.config['BABEL_SUPPORTED_LOCALES']:
+        with current_app.test_request_context('/'):
+            session['lang'] = locale
+            get_challenge_view(challenge.edition_number, challenge.number, locale)
+            get_challenge_grid_rows(challenge.edition_number, locale, False, now=start_date)
+        pages += 2
+    details = {'pages': pages}
+
+    match = CONTAINER_IMAGE_PATTERN.search(challenge.description)
+    if RELEASE_WARM_POOL and match is not None:
+        details['image'] = match.group(1)
+        try:
+            container_manager_client.prepare_image(match.group(1), RELEASE_WARM_POOL)
+            details['warm_pool'] = RELEASE_WARM_POOL
+        except ContainerManagerError as e:
+            logging.warning(f"Container manager could not prepare image {match.group(1)}: {e.message}")
+            details['warm_pool'] = 0
+
+    return details
+
+
+def statistics_badge(challenge_id):
+    summary = challenge_statistics.summary(challenge_id)
+    if summary is None:
+        return ''
+
+    badge = (f'<span class="badge badge-pill badge-secondary mr-1" title="{escape(_("Solves"))}">'
+             f'<i class="fas fa-users"></i> {summary["solves"]}</span>')
+    if summary['rating_average'] is not None:
+        badge += (f'<span class="badge badge-pill badge-secondary mr-1" title="{escape(_("Average rating"))}">'
+                  f'<i class="fas fa-star"></i> {summary["rating_average"]:.1f}</span>')
+    return badge
+
+
+@ctf.route('/')
 def home():
-    user_id = session['user']['id'] if 'user' in session else None
-    challenges = Challenge.query.filter_by(edition_number=CURRENT_EDITION_NUM).order_by(Challenge.number).all()
+    user_id = session.get('user_id')
 
-    solved_challenges_ids = []
+    solved_challenges_ids = set()
     if user_id is not None:
-        solved_challenges = db.session.query(Solve.challenge_id).filter_by(user_id=user_id).all()
-        solved_challenges_ids = [solve.challenge_id for solve in solved_challenges]
+        solved_challenges_ids = scoreboard.solved_challenges(user_id)
 
-    for chg in challenges:
-        chg.solved = chg.id in solved_challenges_ids
+    rows = get_challenge_grid_rows(current_edition.get(), get_locale(), is_admin())
+    challenge_grid = Markup(''.join(
+        (solved_row if ch_id in solved_challenges_ids else row).replace(STATISTICS_MARKER, statistics_badge(ch_id))
+        for ch_id, row, solved_row in rows
+    ))
 
-    return render_template('index.html', challenges=challenges, is_admin=is_admin())
+    return render_template('index.html', challenge_grid=challenge_grid, is_admin=is_admin())
 
 
-@app.route('/contact')
+@ctf.route('/contact')
 def contact():
     return render_template('contact.html')
 
 
-@app.route('/privacy-policy')
+@ctf.route('/privacy-policy')
 def privacy_policy():
     return render_template('privacy_policy.html')
 
 
-@app.route('/profile')
+@ctf.route('/profile')
 @login_required
 def profile():
     return render_template('profile.html')
 
 
-@app.route('/login', methods=['GET'])
+@ctf.route('/login', methods=['GET'])
 def login():
     oauth_token = request.args.get('oauth_token')
     oauth_verifier = request.args.get('oauth_verifier')
     if oauth_token and oauth_verifier:
         try:
-            usosapi.authorize(oauth_token, oauth_verifier)
-            user_data = usosapi.fetch_from_service(
+            usos_session = usosapi.authorize(oauth_token, oauth_verifier)
+            user_data = usos_session.fetch_from_service(
                 'services/users/user',
                 fields='id|first_name|last_name|email|photo_urls[200x200]'
             )
 
-            user = User.query.filter_by(id=user_data['id']).first()
-            if user is None:
-                user = User(
-                    id=user_data['id'],
-                    first_name=user_data['first_name'],
-                    last_name=user_data['last_name'],
-                    email=user_data['email'],
-                    photo_url=user_data['photo_urls']['200x200']
-                )
-                db.session.add(user)
-                db.session.commit()
-
-            session['logged_in'] = True
-            session['user'] = {
-                'id': user_data['id'],
+            profile = {
                 'first_name': user_data['first_name'],
                 'last_name': user_data['last_name'],
                 'email': user_data['email'],
                 'photo_url': user_data['photo_urls']['200x200'],
-                'is_admin': True if user_data['id'] in ADMIN_IDS else False
             }
+
+            # Keep the stored profile in sync with USOS, so changes show up on every worker
+            user = db.session.get(User, user_data['id'])
+            changed = user is None
+            if user is None:
+                user = User(id=user_data['id'], **profile)
+                db.session.add(user)
+                db.session.commit()
+            elif any(getattr(user, field) != value for field, value in profile.items()):
+                for field, value in profile.items():
+                    setattr(user, field, value)
+                db.session.commit()
+                user_cache.invalidate(user.id)
+                changed = True
+
+            if changed:
+                scoreboard.add_user(user.id, user.first_name, user.last_name)
+                leak_index.add_user(user.id)
+                shared_state.publish(
+                    'users', {'user_id': user.id, 'first_name': user.first_name, 'last_name': user.last_name}
+                )
+
+            language = session.get('lang')
+            session.clear()
+            session.regenerate()
+            session['user_id'] = user.id
+            if language is not None:
+                session['lang'] = language
             logging.info(f"User {user_data['id']} logged in")
 
-            return redirect(url_for('home'))
+            return redirect(url_for('ctf.home'))
 
         except USOSAPIAuthorizationError:
             flash(_("Error during USOS authentication. Please try again."), "danger")
+        except USOSAPIConnectionError as e:
+            logging.warning(e.message)
+            flash(_("USOS is not responding. Please try again later."), "danger")
 
     return render_template('login.html')
 
 
-@app.route('/usos_auth')
+@ctf.route('/usos_auth')
+@rate_limiter.limit('usos_auth')
 def usos_auth():
-    _, request_url = usosapi.get_auth_url(callback=url_for('login', _external=True))
+    try:
+        _request_token, request_url = usosapi.get_auth_url(callback=url_for('ctf.login', _external=True))
+    except USOSAPIConnectionError as e:
+        logging.warning(e.message)
+        flash(_("USOS is not responding. Please try again later."), "danger")
+        return redirect(url_for('ctf.login'))
+
     return redirect(request_url)
 
 
-@app.route('/logout')
+@ctf.route('/logout')
 @login_required
 def logout():
     session.clear()
+    session.regenerate()
     flash(_("You have been logged out."), "success")
-    return redirect(url_for('home'))
+    return redirect(url_for('ctf.home'))
 
 
-@app.route('/challenge/<edition_number>/<challenge_number>')
+@ctf.route('/challenge/<int:edition_number>/<int:challenge_number>')
 @login_required
 def challenge(edition_number, challenge_number):
-    lang = get_locale()
-    challenge = Challenge.query.filter_by(edition_number=edition_number, number=challenge_number).first_or_404()
+    view = get_challenge_view(edition_number, challenge_number, get_locale())
 
-    if not challenge.is_available() and not is_admin():
+    if datetime.now() < view['start_date'] and not is_admin():
         flash(_("Challenge not available yet."), "danger")
-        return redirect(url_for('home'))
-
-    ch_id = challenge.id
-    ch_start = challenge.start_date
-    ch_name = challenge.name_pl if lang == 'pl' else challenge.name
-    ch_desc = challenge.description_pl if lang == 'pl' else challenge.description
+        return redirect(url_for('ctf.home'))
 
-    user_id = session['user']['id']
-    solve = Solve.query.filter_by(user_id=user_id, challenge_id=ch_id).first()
-    ch_solved = solve is not None
+    ch_id = view['id']
+    ch_start = view['start_date']
+    ch_name = view['name']
+    ch_desc = view['description']
 
-    top_solves = (db.session.query(
-        User.first_name,
-        User.last_name,
-        Solve.solve_time
-    )
-        .join(Solve, Solve.user_id == User.id)
-        .filter(Solve.challenge_id == ch_id)
-        .order_by(Solve.solve_time.asc())
-        .limit(5)
-        .all())
+    user_id = session['user_id']
+    archived = edition_archive.get(edition_number) is not None
+    board = edition_scoreboard(edition_number)
+    statistics_source = edition_statistics(edition_number)
+    ch_solved = board.is_solved(user_id, ch_id)
 
     def format_time_difference(start_time, end_time):
         if end_time < start_time:
@@ -233,58 +1150,215 @@ def challenge(edition_number, challenge_number):
         return f"{days}d {hours}h {minutes}m {seconds}s"
 
     top_solvers = [
-        {'nick': f"{user_name} {user_last_name[0]}.", 'time': format_time_difference(ch_start, solve_time)}
-        for user_name, user_last_name, solve_time in top_solves
+        {'nick': nick, 'time': format_time_difference(ch_start, solve_time)}
+        for _user_id, nick, solve_time in board.top_solvers(ch_id)
     ]
 
-    user_rating = Rating.query.filter_by(user_id=user_id, challenge_id=ch_id).first()
-    rating = user_rating.rating if user_rating else 0
+    statistics = statistics_source.summary(ch_id)
+    if statistics is not None and statistics['median_solve_seconds'] is not None:
+        statistics['median_solve_time'] = format_time_difference(
+            ch_start, ch_start + timedelta(seconds=statistics['median_solve_seconds'])
+        )
 
-    user_comment = Comment.query.filter_by(user_id=user_id, challenge_id=ch_id).first()
-    comment = user_comment.comment if user_comment else None
+    with edition_session(edition_number) as source:
+        comment = source.query(Comment.comment).filter_by(user_id=user_id, challenge_id=ch_id).scalar()
 
     return render_template(
         'challenge.html',
         ch_id=ch_id,
         ch_name=ch_name,
         ch_desc=ch_desc,
-        user_rating=rating,
+        user_rating=statistics_source.user_rating(user_id, ch_id),
         user_comment=comment,
         top_solvers=top_solvers,
-        ch_solved=ch_solved
+        statistics=statistics,
+        ch_solved=ch_solved,
+        archived=archived
+    )
+
+
+def known_editions():
+    return sorted(set(challenge_statistics.editions()) | set(edition_archive.edition_numbers()))
+
+
+@ctf.route('/scoreboard')
+def scoreboard_page():
+    edition_number = request.args.get('edition', current_edition.get(), type=int)
+    return render_template(
+        'scoreboard.html',
+        editions=known_editions(),
+        edition_number=edition_number,
+        ranking=edition_scoreboard(edition_number).ranking(edition_number)
     )
 
 
-@app.route('/submit_flag/<challenge_id>', methods=['POST'])
+@ctf.route('/scoreboard.json')
+def scoreboard_json():
+    edition_number = request.args.get('edition', current_edition.get(), type=int)
+    return jsonify({
+        'edition_number': edition_number,
+        'ranking': edition_scoreboard(edition_number).ranking(edition_number)
+    })
+
+
+@ctf.route('/metrics')
+def metrics_page():
+    if not is_admin():
+        abort(404)
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@ctf.route('/metrics/slow_requests')
+def slow_requests():
+    if not is_admin() or not SLOW_REQUEST_THRESHOLD:
+        abort(404)
+
+    return jsonify(slow_request_sampler.recent())
+
+
+@ctf.route('/admin/statistics')
+def admin_statistics():
+    if not is_admin():
+        abort(404)
+
+    edition_number = request.args.get('edition', current_edition.get(), type=int)
+    challenge_id = request.args.get('challenge', type=int)
+    before = request.args.get('before', type=int)
+
+    with edition_session(edition_number) as source:
+        challenges = (source.query(Challenge.id, Challenge.number, Challenge.name)
+                      .filter_by(edition_number=edition_number)
+                      .order_by(Challenge.number)
+                      .all())
+
+        # Keyset pagination, every page is a short index range scan however many comments there are
+        query = (source.query(Comment.id, Comment.comment, Challenge.number, User.first_name, User.last_name)
+                 .join(Challenge, Comment.challenge_id == Challenge.id)
+                 .join(User, Comment.user_id == User.id))
+        if challenge_id is not None:
+            query = query.filter(Comment.challenge_id == challenge_id)
+        else:
+            query = query.filter(Challenge.edition_number == edition_number)
+        if before is not None:
+            query = query.filter(Comment.id < before)
+        comments = query.order_by(Comment.id.desc()).limit(STATISTICS_COMMENTS_PAGE_SIZE + 1).all()
+
+    summaries = edition_statistics(edition_number).edition_summaries(edition_number)
+    rows = [
+        {'id': ch_id, 'number': number, 'name': name, 'statistics': summaries.get(ch_id)}
+        for ch_id, number, name in challenges
+    ]
+
+    next_before = None
+    if len(comments) > STATISTICS_COMMENTS_PAGE_SIZE:
+        comments = comments[:STATISTICS_COMMENTS_PAGE_SIZE]
+        next_before = comments[-1].id
+
+    return render_template(
+        'admin_statistics.html',
+        editions=known_editions(),
+        edition_number=edition_number,
+        challenge_id=challenge_id,
+        rows=rows,
+        comments=comments,
+        next_before=next_before
+    )
+
+
+@ctf.route('/admin/leaks')
+def admin_leaks():
+    if not is_admin():
+        abort(404)
+
+    before = request.args.get('before', type=int)
+
+    submitter = aliased(User)
+    owner = aliased(User)
+    query = (db.session.query(
+                AuditEvent.id, AuditEvent.created_at, AuditEvent.ip_address, AuditEvent.user_id, AuditEvent.payload,
+                Challenge.edition_number, Challenge.number,
+                submitter.first_name.label('submitter_first_name'), submitter.last_name.label('submitter_last_name'),
+                owner.first_name.label('owner_first_name'), owner.last_name.label('owner_last_name'))
+             .outerjoin(Challenge, AuditEvent.challenge_id == Challenge.id)
+             .outerjoin(submitter, AuditEvent.user_id == submitter.id)
+             .outerjoin(owner, AuditEvent.payload == owner.id)
+             .filter(AuditEvent.event == 'flag_leak'))
+    if before is not None:
+        query = query.filter(AuditEvent.id < before)
+    leaks = query.order_by(AuditEvent.id.desc()).limit(LEAKS_PAGE_SIZE + 1).all()
+
+    next_before = None
+    if len(leaks) > LEAKS_PAGE_SIZE:
+        leaks = leaks[:LEAKS_PAGE_SIZE]
+        next_before = leaks[-1].id
+
+    # Players who used the same leaked flags again and again come first
+    pairs = (db.session.query(AuditEvent.user_id, AuditEvent.payload, func.count())
+             .filter(AuditEvent.event == 'flag_leak')
+             .group_by(AuditEvent.user_id, AuditEvent.payload)
+             .order_by(func.count().desc())
+             .limit(LEAKS_PAGE_SIZE)
+             .all())
+
+    return render_template('admin_leaks.html', leaks=leaks, pairs=pairs, next_before=next_before)
+
+
+@ctf.route('/admin/releases')
+def admin_releases():
+    if not is_admin():
+        abort(404)
+
+    overview = release_scheduler.overview()
+    names = dict(db.session.query(Challenge.id, Challenge.name).filter_by(edition_number=current_edition.get()))
+    return render_template(
+        'admin_releases.html',
+        overview=overview,
+        names=names,
+        next_release=release_scheduler.next_release(),
+        now=datetime.now()
+    )
+
+
+@ctf.route('/submit_flag/<int:challenge_id>', methods=['POST'])
+@rate_limiter.limit('submit_flag')
 @login_required
 def submit_flag(challenge_id):
-    flag = generate_flag(challenge_id)
+    if flag_engine.get_template(challenge_id) is None:
+        abort(404)
 
+    user_id = session['user_id']
     user_flag = request.form.get('flag')
-    if user_flag == flag:
-        is_already_solved = Solve.query.filter_by(user_id=session['user']['id'], challenge_id=challenge_id).first()
-        if is_already_solved is None:
-            solve = Solve(
-                user_id=session['user']['id'],
-                challenge_id=challenge_id,
-                solve_time=datetime.now()
-            )
-            db.session.add(solve)
-            db.session.commit()
-            logging.info(f"User {session['user']['id']} solved challenge {challenge_id}")
-
-        logging.info(f"User {session['user']['id']} submitted correct flag \"{user_flag}\" for challenge {challenge_id}")
+    if flag_engine.check(user_id, challenge_id, user_flag):
+        if not scoreboard.is_solved(user_id, challenge_id):
+            solve_time = datetime.now()
+            if upsert_solve(user_id, challenge_id, solve_time):
+                scoreboard.record_solve(user_id, challenge_id, solve_time)
+                challenge_statistics.record_solve(user_id, challenge_id, solve_time)
+                shared_state.bump('solves')
+                logging.info(f"User {user_id} solved challenge {challenge_id}")
+
+        audit_queue.record('flag', user_id, challenge_id, user_flag, True, request.remote_addr)
         flash(_("Correct flag! Well done!"), "success")
     else:
-        logging.info(f"User {session['user']['id']} submitted incorrect flag \"{user_flag}\" for challenge {challenge_id}")
+        audit_queue.record('flag', user_id, challenge_id, user_flag, False, request.remote_addr)
+
+        # Another player's flag for this challenge means it was shared
+        owner_id = leak_index.lookup(challenge_id, user_flag)
+        if owner_id is not None:
+            audit_queue.record('flag_leak', user_id, challenge_id, owner_id, False, request.remote_addr)
+            logging.warning(f"User {user_id} submitted the flag of user {owner_id} for challenge {challenge_id}")
+
         flash(_("Incorrect flag. Try again!"), "danger")
     return redirect(request.referrer)
 
 
-@app.route('/submit_rating/<challenge_id>', methods=['POST'])
+@ctf.route('/submit_rating/<int:challenge_id>', methods=['POST'])
+@rate_limiter.limit('submit_rating')
 @login_required
 def submit_rating(challenge_id):
-    Challenge.query.filter_by(id=challenge_id).first_or_404()
+    if flag_engine.get_template(challenge_id) is None:
+        abort(404)
 
     data = request.get_json()
     rating_value = data.get('rating')
@@ -292,156 +1366,242 @@ def submit_rating(challenge_id):
     if not rating_value:
         return jsonify({'error': 'Missing data'}), 400
 
-    user_id = session['user']['id']
-    rating = Rating.query.filter_by(user_id=user_id, challenge_id=challenge_id).first()
-
-    if rating:
-        rating.rating = rating_value
-    else:
-        new_rating = Rating(user_id=user_id, challenge_id=challenge_id, rating=rating_value)
-        db.session.add(new_rating)
-
-    db.session.commit()
-    logging.info(f"User {user_id} submitted rating for challenge {challenge_id}")
+    try:
+        rating_value = int(rating_value)
+    except (TypeError, ValueError):
+        rating_value = None
+    if rating_value not in RATING_VALUES:
+        return jsonify({'error': 'Invalid rating'}), 400
+
+    user_id = session['user_id']
+    upsert_rating(user_id, challenge_id, rating_value)
+    challenge_statistics.record_rating(user_id, challenge_id, rating_value)
+    shared_state.publish(
+        'feedback', {'kind': 'rating', 'user_id': user_id, 'challenge_id': challenge_id, 'rating': rating_value}
+    )
+    audit_queue.record('rating', user_id, challenge_id, str(rating_value), ip_address=request.remote_addr)
 
     return jsonify({'success': 'Rating saved'}), 200
 
 
-@app.route('/submit_comment/<challenge_id>', methods=['POST'])
+@ctf.route('/submit_comment/<int:challenge_id>', methods=['POST'])
+@rate_limiter.limit('submit_comment')
 @login_required
 def submit_comment(challenge_id):
-    Challenge.query.filter_by(id=challenge_id).first_or_404()
+    if flag_engine.get_template(challenge_id) is None:
+        abort(404)
 
     new_comment = request.form.get('comment')
-    user_id = session['user']['id']
-
-    saved_comment = Comment.query.filter_by(user_id=user_id, challenge_id=challenge_id).first()
-    if saved_comment is None:
-        comment = Comment(
-            user_id=user_id,
-            challenge_id=challenge_id,
-            comment=new_comment
-        )
-        db.session.add(comment)
-    else:
-        saved_comment.comment = new_comment
+    user_id = session['user_id']
 
-    db.session.commit()
-    logging.info(f"User {user_id} submitted comment for challenge {challenge_id}")
+    upsert_comment(user_id, challenge_id, new_comment)
+    challenge_statistics.record_comment(user_id, challenge_id)
+    shared_state.publish('feedback', {'kind': 'comment', 'user_id': user_id, 'challenge_id': challenge_id})
+    audit_queue.record('comment', user_id, challenge_id, ip_address=request.remote_addr)
 
     return redirect(request.referrer)
 
 
-@app.route('/container_manager/manager/<image>/<challenge_id>')
-@app.route('/container_manager/manager/<image>', defaults={'challenge_id': None})
+@ctf.route('/container_manager/manager/<image>/<challenge_id>')
+@ctf.route('/container_manager/manager/<image>', defaults={'challenge_id': None})
 @login_required
 def container_manager(image, challenge_id):
     return render_template(
         'container_manager.html',
         image=image,
         manager_domain=CONTAINER_MANAGER_DOMAIN,
-        challenge_id=challenge_id
+        challenge_id=challenge_id,
+        launch_poll_interval=CONTAINER_LAUNCH_POLL_INTERVAL * 1000
     )
 
 
-def get_headers():
-    return {
-        'X-Secret-Key': SECRET_KEY,
-        'Content-Type': 'application/json'
-    }
-
-
 def generate_flag(challenge_id):
-    flag_template = FLAG_DEFAULT_TEMPLATE
-    if challenge_id is not None:
-        flag_template = Challenge.query.filter_by(id=challenge_id).first_or_404().flag
+    flag = flag_engine.flag_for(session['user_id'], challenge_id)
+    if flag is None:
+        abort(404)
+
+    return flag
 
-    text_to_encode = f"secret_{session['user']['id']}_{flag_template}"
-    noise = hashlib.sha256(text_to_encode.encode()).hexdigest()[:FLAG_NOISE_LENGTH]
 
-    return flag_template.replace(FLAG_NOISE_TAG, noise)
+def container_manager_call(operation, *args):
+    try:
+        return jsonify(operation(*args))
+    except ContainerManagerBusyError as e:
+        logging.warning(f"Container manager call {operation.__name__} rejected: {e.message}")
+        return jsonify({'error': _("Container manager is busy. Please try again in a moment.")}), 503
+    except ContainerManagerError as e:
+        logging.warning(f"Container manager call {operation.__name__} failed: {e.message}")
+        return jsonify({'error': _("Container manager is unavailable. Please try again later.")}), 503
 
 
-@app.route('/container_manager/container_status/<image>')
+@ctf.route('/container_manager/container_status/<image>')
+@rate_limiter.limit('container_status')
 @login_required
 def container_status(image):
-    session_id = session['user']['id']
-    response = requests.post(
-        f'{CONTAINER_MANAGER_API}/container_status/{image}',
-        json={'session_id': session_id},
-        headers=get_headers()
+    session_id = session['user_id']
+    return container_manager_call(container_status_hub.get_status, session_id, image)
+
+
+@ctf.route('/container_manager/container_status_stream/<image>')
+@rate_limiter.limit('container_status')
+@login_required
+def container_status_stream(image):
+    if not container_status_hub.open_stream():
+        return jsonify({'error': _("Container manager is busy. Please try again in a moment.")}), 503
+
+    session_id = session['user_id']
+    response = Response(
+        container_status_hub.stream(session_id, image, lifetime=CONTAINER_STATUS_STREAM_LIFETIME),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
-    return jsonify(response.json())
+    response.call_on_close(container_status_hub.close_stream)
+    return response
 
 
-@app.route('/container_manager/make_container/<image>/<challenge_id>')
-@app.route('/container_manager/make_container/<image>', defaults={'challenge_id': None})
+@ctf.route('/container_manager/make_container/<image>/<int:challenge_id>')
+@ctf.route('/container_manager/make_container/<image>', defaults={'challenge_id': None})
+@rate_limiter.limit('container_action')
 @login_required
 def make_container(image, challenge_id):
-    session_id = session['user']['id']
+    session_id = session['user_id']
 
     flag = generate_flag(challenge_id)
 
-    response = requests.post(
-        f'{CONTAINER_MANAGER_API}/make_container/{image}',
-        json={
-            'session_id': session_id,
-            'flag': flag
-        },
-        headers=get_headers()
-    )
-    return jsonify(response.json())
+    # Launches wait in a queue, the page polls launch_status for its position until the container is up
+    response = container_manager_call(container_admission.submit, session_id, image, flag)
+    if response.status_code == 200:
+        response.status_code = 202
+    return response
+
+
+@ctf.route('/container_manager/launch_status/<image>')
+@rate_limiter.limit('container_status')
+@login_required
+def launch_status(image):
+    return jsonify(container_admission.status(session['user_id'], image) or {})
 
 
-@app.route('/container_manager/remove_container')
+@ctf.route('/container_manager/remove_container')
+@rate_limiter.limit('container_action')
 @login_required
 def remove_container():
-    session_id = session['user']['id']
-    response = requests.delete(
-        f'{CONTAINER_MANAGER_API}/remove_container',
-        json={'session_id': session_id},
-        headers=get_headers()
-    )
-    return jsonify(response.json())
+    session_id = session['user_id']
+    response = container_manager_call(container_manager_client.remove_container, session_id)
+    container_status_hub.invalidate(session_id)
+    return response
 
 
-@app.route('/container_manager/extend_container')
+@ctf.route('/container_manager/extend_container')
+@rate_limiter.limit('container_action')
 @login_required
 def extend_container():
-    session_id = session['user']['id']
-    response = requests.post(
-        f'{CONTAINER_MANAGER_API}/extend_container',
-        json={'session_id': session_id},
-        headers=get_headers()
-    )
-    return jsonify(response.json())
+    session_id = session['user_id']
+    response = container_manager_call(container_manager_client.extend_container, session_id)
+    container_status_hub.invalidate(session_id)
+    return response
 
 
-@app.route('/container_manager/restart_container')
+@ctf.route('/container_manager/restart_container')
+@rate_limiter.limit('container_action')
 @login_required
 def restart_container():
-    session_id = session['user']['id']
-    response = requests.post(
-        f'{CONTAINER_MANAGER_API}/restart_container',
-        json={'session_id': session_id},
-        headers=get_headers()
-    )
-    return jsonify(response.json())
+    session_id = session['user_id']
+    response = container_manager_call(container_manager_client.restart_container, session_id)
+    container_status_hub.invalidate(session_id)
+    return response
 
 
-@app.route('/download/<filename>')
+@ctf.route('/download/<filename>')
 def download_file(filename):
-    logging.info(f"User {session['user']['id']} downloaded file {filename}")
-    return send_from_directory('static/ctf_files', filename)
-
-
-def cleanup_usos_sessions():
-    while True:
-        logging.info(f"Cleaning up usos sessions")
-
-        usosapi.cleanup_auth_sessions()
-
-        time.sleep(USOSAPI_SESSION_CHECK)
-
+    response = download_store.send(
+        filename,
+        max_age=DOWNLOAD_MAX_AGE,
+        offload=DOWNLOAD_OFFLOAD,
+        accel_prefix=DOWNLOAD_ACCEL_PREFIX
+    )
 
-threading.Thread(target=cleanup_usos_sessions, daemon=True).start()
+    if response.status_code != 304:
+        user_id = session.get('user_id')
+        audit_queue.record('download', user_id, payload=filename, ip_address=request.remote_addr)
+    return response
+
+
+def warm_services():
+    services = current_app.extensions[SERVICES_EXTENSION]
+    for name in WARMUP_SERVICES:
+        services.get(name)
+
+
+def warm_file_stores():
+    # Hash and compress the files up front instead of on their first request
+    download_store.warm()
+    static_store.warm(skip=[os.path.relpath(DOWNLOAD_DIRECTORY, current_app.static_folder)])
+
+
+def create_app(config=None):
+    # Cheap on purpose: nothing is read, connected or started here, services are built on first use
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY=os.environ.get('EE_CTF_SECRET_KEY', os.urandom(24)),
+        SQLALCHEMY_DATABASE_URI=get_database_uri(),
+        BABEL_DEFAULT_LOCALE='pl',
+        BABEL_SUPPORTED_LOCALES=['en', 'pl'],
+        SESSION_COOKIE_SAMESITE='Lax',
+        SHARED_STATE_PATH=SHARED_STATE_PATH,
+        SESSION_STORE_PATH=SESSION_STORE_PATH,
+        USOSAPI_TOKEN_STORE_PATH=USOSAPI_TOKEN_STORE_PATH,
+        USOSAPI_CREDENTIALS_FILE=USOSAPI_CREDENTIALS_FILE,
+        CONTAINER_MANAGER_SECRET_FILE=CONTAINER_MANAGER_SECRET_FILE,
+        CONTAINER_MANAGER_API=CONTAINER_MANAGER_API,
+        ARCHIVE_DIRECTORY=ARCHIVE_DIRECTORY,
+    )
+    if config is not None:
+        app.config.update(config)
+
+    babel.init_app(app)
+    init_database(app, pool_size=SERVER_THREADS)
+
+    services = ServiceRegistry()
+    for name, factory in SERVICE_FACTORIES.items():
+        services.register(name, factory)
+    app.extensions[SERVICES_EXTENSION] = services
+
+    # Started by the server only, so the CLI and tests never run them
+    tasks = BackgroundTasks(app)
+    tasks.add('audit-writer', lambda: audit_queue.start(), lambda: audit_queue.stop())
+    tasks.add_thread('service-warmup', warm_services)
+    tasks.add_thread('file-warmup', warm_file_stores)
+    tasks.add('release-scheduler', lambda: release_scheduler.start(), lambda: release_scheduler.stop())
+    if SLOW_REQUEST_THRESHOLD:
+        tasks.add('slow-request-sampler', lambda: slow_request_sampler.start(), lambda: slow_request_sampler.stop())
+    app.extensions[TASKS_EXTENSION] = tasks
+
+    # The cookie only carries an opaque session id, the session data stays on the server
+    app.session_interface = ServerSessionInterface(session_store)
+
+    app.before_request(start_request_metrics)
+    app.after_request(record_request_metrics)
+    # Registered after the metrics, so it runs before them and the timing includes compression
+    app.after_request(compress_response)
+    app.teardown_request(end_request_sampling)
+    app.before_request(sync_shared_state)
+    app.url_defaults(add_static_fingerprint)
+    app.view_functions['static'] = serve_static
+    app.register_error_handler(RateLimitExceeded, rate_limit_exceeded)
+    app.context_processor(inject_conf_var)
+    app.register_blueprint(ctf)
+
+    return app
+
+
+def create_schema(app):
+    # create_all alone skips indexes on existing tables, and the upserts need the unique ones
+    with app.app_context():
+        upgrade_database(db.engine)
+
+
+def start_background_tasks(app):
+    tasks = app.extensions[TASKS_EXTENSION]
+    tasks.start()
+    atexit.register(tasks.stop)
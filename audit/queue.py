@@ -0,0 +1,101 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+POLICY_DROP = 'drop'
+POLICY_BLOCK = 'block'
+
+
+class AuditQueue:
+    def __init__(self, app, db, model, max_size=10_000, batch_size=500, flush_interval=1.0,
+                 policy=POLICY_DROP, block_timeout=0.05):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+
+        self.queue = queue.Queue(maxsize=max_size)
+        self.stopped = threading.Event()
+        self.worker = None
+
+        self.stats_lock = threading.Lock()
+        self.stats = {'queued': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+
+    def record(self, event, user_id=None, challenge_id=None, payload=None, correct=None, ip_address=None):
+        row = {
+            'event': event,
+            'user_id': user_id,
+            'challenge_id': challenge_id,
+            'payload': payload,
+            'correct': correct,
+            'ip_address': ip_address,
+            'created_at': datetime.now()
+        }
+
+        try:
+            if self.policy == POLICY_BLOCK:
+                self.queue.put(row, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('queued')
+        return True
+
+    def start(self):
+        if self.worker is not None:
+            return
+
+        self.worker = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
+
+    def _count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while not self.stopped.is_set() or not self.queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                self.db.session.execute(insert(self.model), batch)
+                self.db.session.commit()
+                self._count('written', len(batch))
+            except Exception as e:
+                self.db.session.rollback()
+                self._count('failed', len(batch))
+                logging.error(f"Failed to write {len(batch)} audit events: {e}")
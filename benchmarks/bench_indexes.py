@@ -0,0 +1,116 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import db, User, Challenge, Solve, Rating, Comment, upgrade_database  # noqa: E402
+
+
+def seed(engine, solves_count, challenges_count, editions):
+    users_count = solves_count // challenges_count + 1
+    start = datetime(2024, 1, 1)
+    rnd = random.Random(42)
+
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'id': str(i), 'first_name': f'User{i}', 'last_name': 'Test', 'email': f'{i}@example.com', 'photo_url': ''}
+            for i in range(users_count)
+        ])
+        connection.execute(insert(Challenge), [
+            {
+                'id': i + 1, 'number': i % (challenges_count // editions) + 1,
+                'edition_number': i // (challenges_count // editions) + 1,
+                'name': f'Challenge {i}', 'name_pl': f'Zadanie {i}', 'description': '', 'description_pl': '',
+                'start_date': start, 'difficulty': 'Easy', 'flag': 'EE_CTF{<noise>}', 'icon': 'fas fa-flag'
+            }
+            for i in range(challenges_count)
+        ])
+
+        pairs = [(str(u), c + 1) for u in range(users_count) for c in range(challenges_count)][:solves_count]
+        rnd.shuffle(pairs)
+        connection.execute(insert(Solve), [
+            {'user_id': u, 'challenge_id': c, 'solve_time': start + timedelta(seconds=rnd.randint(0, 10 ** 6))}
+            for u, c in pairs
+        ])
+        connection.execute(insert(Rating), [
+            {'user_id': u, 'challenge_id': c, 'rating': rnd.randint(1, 5)} for u, c in pairs[::5]
+        ])
+        connection.execute(insert(Comment), [
+            {'user_id': u, 'challenge_id': c, 'comment': 'Nice one'} for u, c in pairs[::10]
+        ])
+
+    return users_count
+
+
+def drop_indexes(engine):
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+
+
+def run_queries(engine, users_count, challenges_count, iterations):
+    rnd = random.Random(7)
+    editions = {1: challenges_count}
+    queries = {
+        'solve by user/challenge': lambda s, u, c: s.execute(
+            select(Solve.id).filter_by(user_id=u, challenge_id=c)).first(),
+        'top 5 solvers': lambda s, u, c: s.execute(
+            select(User.first_name, User.last_name, Solve.solve_time)
+            .join(Solve, Solve.user_id == User.id)
+            .filter(Solve.challenge_id == c)
+            .order_by(Solve.solve_time.asc())
+            .limit(5)).all(),
+        'challenge by edition/number': lambda s, u, c: s.execute(
+            select(Challenge.id).filter_by(edition_number=1, number=c % editions[1] + 1)).first(),
+        'rating by user/challenge': lambda s, u, c: s.execute(
+            select(Rating.rating).filter_by(user_id=u, challenge_id=c)).first(),
+        'comment by user/challenge': lambda s, u, c: s.execute(
+            select(Comment.comment).filter_by(user_id=u, challenge_id=c)).first(),
+    }
+
+    results = {}
+    with engine.connect() as connection:
+        for name, query in queries.items():
+            started = time.perf_counter()
+            for _ in range(iterations):
+                query(connection, str(rnd.randrange(users_count)), rnd.randrange(challenges_count) + 1)
+            results[name] = (time.perf_counter() - started) / iterations * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare query latency before and after upgrade-db indexes')
+    parser.add_argument('--solves', type=int, default=100_000)
+    parser.add_argument('--challenges', type=int, default=40)
+    parser.add_argument('--editions', type=int, default=2)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        db.metadata.create_all(engine)
+        drop_indexes(engine)
+
+        users_count = seed(engine, args.solves, args.challenges, args.editions)
+        before = run_queries(engine, users_count, args.challenges, args.iterations)
+
+        upgrade_database(engine)
+        after = run_queries(engine, users_count, args.challenges, args.iterations)
+
+        engine.dispose()
+
+    print(f"{'query':<30}{'before [ms]':>14}{'after [ms]':>14}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<30}{before[name]:>14.3f}{after[name]:>14.3f}{before[name] / after[name]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import json
+import logging
+import math
+import os
+import queue
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeUSOS, FakeContainerManager  # noqa: E402
+from flags import FlagEngine  # noqa: E402
+from model import db, init_database, User, Challenge, Solve  # noqa: E402
+
+EDITION = 2
+IMAGE = 'benchmark'
+FLAG_TEMPLATE = 'EE_CTF{<noise>}'
+DEFAULT_RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PERCENTILES = (50, 95, 99)
+LAUNCH_POLL_INTERVAL = 0.5
+
+
+def seed(database_uri, users, challenges, solves_per_user):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    init_database(app, pool_size=1)
+
+    now = datetime.now()
+    rnd = random.Random(0)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            User(id=str(i), first_name=f'User{i}', last_name='Benchmark', email='', photo_url='')
+            for i in range(users)
+        ])
+        # One challenge per day, the last one opens with the benchmark
+        db.session.add_all([
+            Challenge(
+                id=i + 1, number=i + 1, edition_number=EDITION, name=f'Challenge {i + 1}',
+                name_pl=f'Zadanie {i + 1}', description='Lorem ipsum ' * 100, description_pl='Lorem ipsum ' * 100,
+                start_date=now - timedelta(days=challenges - 1 - i), difficulty='Easy', flag=FLAG_TEMPLATE,
+                icon='fas fa-flag'
+            )
+            for i in range(challenges)
+        ])
+        db.session.add_all([
+            Solve(user_id=str(user), challenge_id=challenge_id,
+                  solve_time=now - timedelta(minutes=rnd.randrange(10_000)))
+            for user in range(users)
+            for challenge_id in rnd.sample(range(1, challenges), min(solves_per_user, challenges - 1))
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def write_credentials(directory, usos, container_manager):
+    os.makedirs(os.path.join(directory, 'credentials'))
+    with open(os.path.join(directory, 'credentials', 'usos_api_credentials.json'), 'w') as file:
+        json.dump({'api_base_address': usos.url, 'consumer_key': 'benchmark', 'consumer_secret': 'benchmark'}, file)
+    with open(os.path.join(directory, 'credentials', 'container_manager_secret.json'), 'w') as file:
+        json.dump({'secret': 'benchmark'}, file)
+
+
+def app_environment(directory, container_manager):
+    return {
+        'EE_CTF_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        'EE_CTF_CONTAINER_MANAGER_API': container_manager.url,
+        'EE_CTF_SECRET_KEY': 'benchmark',
+        'EE_CTF_TRUSTED_PROXY': '127.0.0.1',
+    }
+
+
+class InProcessClient:
+    def __init__(self, app, ip_address):
+        self.client = app.test_client()
+        self.client.environ_base['REMOTE_ADDR'] = ip_address
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.open(path, method=method, data=data, headers=headers)
+        response.get_data()
+        return response.status_code, response.headers.get('Location')
+
+    def get_json(self, path):
+        return self.client.get(path).get_json()
+
+
+class HTTPClient:
+    def __init__(self, base_url, ip_address):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['X-Forwarded-For'] = ip_address
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.session.request(method, self.base_url + path, data=data, headers=headers,
+                                        allow_redirects=False, timeout=60)
+        return response.status_code, response.headers.get('Location')
+
+    def get_json(self, path):
+        return self.session.get(self.base_url + path, timeout=60).json()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def timed(self, client, route, method, path, data=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, location = client.request(method, path, data=data, headers=headers)
+        except requests.RequestException:
+            status, location = 'error', None
+        self.record(route, time.perf_counter() - start, status)
+        return status, location
+
+    def record(self, route, elapsed, status):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+
+    def summary(self, duration):
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            routes[route] = {
+                'requests': len(latencies),
+                'throughput': len(latencies) / duration,
+                'statuses': {str(status): count for status, count in sorted(self.statuses[route].items(), key=str)},
+                **{f'p{p}': percentile(latencies, p) * 1000 for p in PERCENTILES},
+            }
+        return routes
+
+
+def percentile(values, p):
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def play_round(client, user_id, usos, recorder, challenge, flag, attempts):
+    _status, location = recorder.timed(client, 'usos_auth', 'GET', '/usos_auth')
+    request_token = parse_qs(urlparse(location or '').query).get('oauth_token', [''])[0]
+    usos.approve(request_token, user_id)
+    recorder.timed(client, 'login', 'GET', f'/login?oauth_token={request_token}&oauth_verifier=benchmark')
+
+    recorder.timed(client, 'home', 'GET', '/')
+    challenge_path = f'/challenge/{EDITION}/{challenge}'
+    recorder.timed(client, 'challenge', 'GET', challenge_path)
+
+    headers = {'Referer': challenge_path}
+    for attempt in range(attempts):
+        submitted = flag if attempt == attempts - 1 else f'EE_CTF{{wrong{attempt}}}'
+        recorder.timed(client, 'submit_flag', 'POST', f'/submit_flag/{challenge}', data={'flag': submitted},
+                       headers=headers)
+
+    recorder.timed(client, 'container_status', 'GET', f'/container_manager/container_status/{IMAGE}')
+    launch_started = time.perf_counter()
+    status, _location = recorder.timed(client, 'make_container', 'GET',
+                                       f'/container_manager/make_container/{IMAGE}/{challenge}')
+    if status == 202:
+        # Launches are queued, wait like the container manager page does
+        state = 'queued'
+        while state in ('queued', 'starting'):
+            time.sleep(LAUNCH_POLL_INTERVAL)
+            state = client.get_json(f'/container_manager/launch_status/{IMAGE}').get('state')
+        recorder.record('container_ready', time.perf_counter() - launch_started, state)
+    recorder.timed(client, 'container_status', 'GET', f'/container_manager/container_status/{IMAGE}')
+    recorder.timed(client, 'home', 'GET', '/')
+
+
+def run_scenario(make_client, usos, args):
+    flags = FlagEngine(lambda challenge_id: FLAG_TEMPLATE, FLAG_TEMPLATE, '<noise>', 12)
+    recorder = Recorder()
+    players = queue.Queue()
+    for index in range(args.players):
+        players.put(index)
+
+    def player_loop():
+        while True:
+            try:
+                index = players.get_nowait()
+            except queue.Empty:
+                return
+            # Every third player logs in for the first time
+            user_id = str(index if index % 3 else args.users + index)
+            client = make_client(f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}')
+            play_round(client, user_id, usos, recorder, args.challenges, flags.flag_for(user_id, args.challenges),
+                       args.attempts)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=player_loop) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    return recorder.summary(duration), duration
+
+
+def run_in_process(directory, usos, container_manager, args):
+    os.environ.update(app_environment(directory, container_manager))
+    os.chdir(directory)
+    from app import create_app, start_background_tasks
+    logging.getLogger().setLevel(logging.WARNING)
+    app = create_app()
+    start_background_tasks(app)
+
+    return run_scenario(lambda ip_address: InProcessClient(app, ip_address), usos, args)
+
+
+def run_waitress(directory, usos, container_manager, args):
+    env = dict(os.environ, **app_environment(directory, container_manager),
+               EE_CTF_PORT=str(args.port), EE_CTF_WORKERS=str(args.workers))
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'run.py')], cwd=directory, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://localhost:{args.port}'
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(base_url + '/', timeout=1)
+                break
+            except requests.RequestException:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('Server did not start')
+                time.sleep(0.2)
+
+        return run_scenario(lambda ip_address: HTTPClient(base_url, ip_address), usos, args)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_summary(routes, duration, baseline=None):
+    print(f"{'route':<18}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for route, stats in routes.items():
+        print(f"{route:<18}{stats['requests']:>10}{stats['throughput']:>10.1f}"
+              f"{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}  {stats['statuses']}")
+        previous = (baseline or {}).get('routes', {}).get(route)
+        if previous:
+            changes = '  '.join(
+                f"p{p} {(stats[f'p{p}'] - previous[f'p{p}']) / previous[f'p{p}'] * 100:+.0f}%"
+                for p in PERCENTILES if previous[f'p{p}']
+            )
+            print(f"{'':<18}vs {baseline['commit']}: {changes}")
+    print(f"total {sum(stats['requests'] for stats in routes.values())} requests in {duration:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a CTF round opening against the app')
+    parser.add_argument('--mode', choices=('inprocess', 'waitress'), default='inprocess')
+    parser.add_argument('--players', type=int, default=300, help='players taking part in the round')
+    parser.add_argument('--concurrency', type=int, default=32, help='players active at the same time')
+    parser.add_argument('--users', type=int, default=2000, help='registered users seeded in the database')
+    parser.add_argument('--challenges', type=int, default=10)
+    parser.add_argument('--solves-per-user', type=int, default=3)
+    parser.add_argument('--attempts', type=int, default=4, help='flag submissions per player, the last is correct')
+    parser.add_argument('--upstream-latency', type=float, default=0.02,
+                        help='seconds added by fake USOS and container manager')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes in waitress mode')
+    parser.add_argument('--port', type=int, default=8190)
+    parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    usos = FakeUSOS(latency=args.upstream_latency).start()
+    container_manager = FakeContainerManager(latency=args.upstream_latency).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_credentials(directory, usos, container_manager)
+        seed(app_environment(directory, container_manager)['EE_CTF_DATABASE_URI'], args.users, args.challenges,
+             args.solves_per_user)
+
+        if args.mode == 'inprocess':
+            routes, duration = run_in_process(directory, usos, container_manager, args)
+        else:
+            routes, duration = run_waitress(directory, usos, container_manager, args)
+        os.chdir(ROOT)
+
+    usos.stop()
+    container_manager.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_summary(routes, duration, baseline)
+
+    result = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'arguments': {key: value for key, value in vars(args).items() if key not in ('results_dir', 'compare')},
+        'duration': duration,
+        'routes': routes,
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"round-{args.mode}-{result['commit']}-{int(time.time())}.json")
+    with open(path, 'w') as file:
+        json.dump(result, file, indent=2)
+    print(f"results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
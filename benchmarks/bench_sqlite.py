@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import (  # noqa: E402
+    db, init_database, User, Challenge, Solve, upsert_solve, upsert_rating, upsert_comment
+)
+
+
+def make_app(database_uri, tuned, threads):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    if tuned:
+        init_database(app, pool_size=threads)
+    else:
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+    return app
+
+
+def seed(app, users, challenges):
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            User(id=str(i), first_name=f'User{i}', last_name='Test', email='', photo_url='') for i in range(users)
+        ])
+        db.session.add_all([
+            Challenge(
+                id=i + 1, number=i + 1, edition_number=1, name=f'Challenge {i}', name_pl=f'Zadanie {i}',
+                description='', description_pl='', start_date=datetime(2024, 1, 1), difficulty='Easy',
+                flag='EE_CTF{<noise>}', icon='fas fa-flag'
+            )
+            for i in range(challenges)
+        ])
+        db.session.commit()
+
+
+def worker(app, seed_value, users, challenges, deadline, stats, lock):
+    rnd = random.Random(seed_value)
+    done = 0
+    locked = 0
+    with app.app_context():
+        while time.monotonic() < deadline:
+            user_id = str(rnd.randrange(users))
+            challenge_id = rnd.randrange(challenges) + 1
+            operation = rnd.random()
+            try:
+                if operation < 0.6:
+                    db.session.query(Solve.solve_time).filter_by(challenge_id=challenge_id) \
+                        .order_by(Solve.solve_time).limit(5).all()
+                    db.session.commit()
+                elif operation < 0.8:
+                    solve_time = datetime(2024, 1, 1) + timedelta(seconds=rnd.randrange(10 ** 6))
+                    upsert_solve(user_id, challenge_id, solve_time)
+                elif operation < 0.9:
+                    upsert_rating(user_id, challenge_id, rnd.randint(1, 5))
+                else:
+                    upsert_comment(user_id, challenge_id, 'x' * rnd.randrange(50, 500))
+                done += 1
+            except OperationalError:
+                db.session.rollback()
+                locked += 1
+
+    with lock:
+        stats['operations'] += done
+        stats['locked'] += locked
+
+
+def run(tuned, threads, duration, users, challenges):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(f"sqlite:///{os.path.join(directory, 'bench.db')}", tuned, threads)
+        seed(app, users, challenges)
+
+        stats = {'operations': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+        workers = [
+            threading.Thread(target=worker, args=(app, i, users, challenges, deadline, stats, lock))
+            for i in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        with app.app_context():
+            db.engine.dispose()
+
+    return stats['operations'] / duration, stats['locked']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed read/write load against default and tuned SQLite settings')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--challenges', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'configuration':<16}{'ops/s':>10}{'locked errors':>16}")
+    for name, tuned in (('default', False), ('tuned', True)):
+        throughput, locked = run(tuned, args.threads, args.duration, args.users, args.challenges)
+        print(f"{name:<16}{throughput:>10.1f}{locked:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_round import seed  # noqa: E402
+
+# Runs in a fresh interpreter, so every sample pays the imports like a new worker does
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import flask, flask_babel, flask_sqlalchemy, sqlalchemy
+dependencies = time.perf_counter()
+import app
+imported = time.perf_counter()
+instance = app.create_app()
+created = time.perf_counter()
+if sys.argv[1] == 'warm':
+    app.start_background_tasks(instance)
+    services = instance.extensions[app.SERVICES_EXTENSION]
+    while not all(services.loaded(name) for name in app.WARMUP_SERVICES):
+        time.sleep(0.01)
+warmed = time.perf_counter()
+status = instance.test_client().get('/').status_code
+responded = time.perf_counter()
+other = app.create_app().test_client().get('/').status_code
+print(json.dumps({
+    'dependencies': dependencies - started,
+    'import': imported - dependencies,
+    'create_app': created - imported,
+    'warm_up': warmed - created,
+    'first_request': responded - warmed,
+    'statuses': [status, other],
+}))
+'''
+
+STAGES = ('dependencies', 'import', 'create_app', 'warm_up', 'first_request')
+
+
+def write_credentials(directory):
+    os.makedirs(os.path.join(directory, 'credentials'))
+    with open(os.path.join(directory, 'credentials', 'usos_api_credentials.json'), 'w') as file:
+        json.dump({'api_base_address': 'http://127.0.0.1:9/', 'consumer_key': 'benchmark',
+                   'consumer_secret': 'benchmark'}, file)
+    with open(os.path.join(directory, 'credentials', 'container_manager_secret.json'), 'w') as file:
+        json.dump({'secret': 'benchmark'}, file)
+
+
+def probe(directory, mode):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        EE_CTF_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        EE_CTF_SECRET_KEY='benchmark',
+    )
+    output = subprocess.check_output([sys.executable, '-c', PROBE, mode], cwd=directory, env=env,
+                                     stderr=subprocess.DEVNULL, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time a worker takes from start to its first response')
+    parser.add_argument('--users', type=int, default=20_000, help='registered users seeded in the database')
+    parser.add_argument('--challenges', type=int, default=30)
+    parser.add_argument('--solves-per-user', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_credentials(directory)
+        seed(f"sqlite:///{os.path.join(directory, 'benchmark.db')}", args.users, args.challenges,
+             args.solves_per_user)
+
+        print(f"{'mode':<6}{'stage':<16}{'median ms':>12}{'min ms':>10}")
+        for mode in ('cold', 'warm'):
+            samples = [probe(directory, mode) for _ in range(args.runs)]
+            statuses = {status for sample in samples for status in sample['statuses']}
+            for stage in STAGES:
+                values = [sample[stage] * 1000 for sample in samples]
+                print(f"{mode:<6}{stage:<16}{statistics.median(values):>12.1f}{min(values):>10.1f}")
+            boot = [(sample['import'] + sample['create_app']) * 1000 for sample in samples]
+            print(f"{mode:<6}{'boot':<16}{statistics.median(boot):>12.1f}{min(boot):>10.1f}  statuses {statuses}")
+
+
+if __name__ == '__main__':
+    main()
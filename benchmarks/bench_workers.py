@@ -0,0 +1,94 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(workers, port, directory):
+    env = dict(
+        os.environ,
+        EE_CTF_WORKERS=str(workers),
+        EE_CTF_PORT=str(port),
+        EE_CTF_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        EE_CTF_SHARED_STATE=os.path.join(directory, 'shared_state.db'),
+    )
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run.py')],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    url = f'http://localhost:{port}/'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    stop_server(server)
+    raise RuntimeError(f"Server with {workers} workers did not start")
+
+
+def stop_server(server):
+    # SIGTERM lets the launcher stop its workers too
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=30)
+
+
+def client(url, deadline, results):
+    done = 0
+    failed = 0
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=10).read()
+            done += 1
+        except OSError:
+            failed += 1
+    results.put((done, failed))
+
+
+def run(workers, port, clients, duration):
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(workers, port, directory)
+        try:
+            results = multiprocessing.Queue()
+            deadline = time.monotonic() + duration
+            processes = [
+                multiprocessing.Process(target=client, args=(f'http://localhost:{port}/', deadline, results))
+                for _ in range(clients)
+            ]
+            for process in processes:
+                process.start()
+            totals = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+        finally:
+            stop_server(server)
+
+    return sum(done for done, _ in totals) / duration, sum(failed for _, failed in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the home page with 1..N worker processes')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8181)
+    args = parser.parse_args()
+
+    print(f"{'workers':<10}{'req/s':>10}{'errors':>10}")
+    for workers in range(1, args.max_workers + 1):
+        throughput, failed = run(workers, args.port + workers, args.clients, args.duration)
+        print(f"{workers:<10}{throughput:>10.1f}{failed:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+OAUTH_TOKEN_HEADER = re.compile(r'oauth_token="([^"]*)"')
+
+
+class FakeServer:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch()
+
+            def do_POST(self):
+                self._dispatch()
+
+            def do_DELETE(self):
+                self._dispatch()
+
+            def _dispatch(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with server.lock:
+                    server.calls += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                content_type, payload = server.handle(self, body)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, request, body):
+        raise NotImplementedError
+
+
+# OAuth1 endpoints and the user profile service without signature checks. A benchmark client approves
+# a request token for a user id, as if that user logged in on the USOS page, before following the callback.
+class FakeUSOS(FakeServer):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.request_tokens = itertools.count()
+        self.access_tokens = itertools.count()
+        self.approved = {}
+
+    def approve(self, request_token, user_id):
+        with self.lock:
+            self.approved[request_token] = user_id
+
+    def handle(self, request, body):
+        path = urlparse(request.path).path
+        if path.endswith('services/oauth/request_token'):
+            return 'text/plain', f'oauth_token=rt{next(self.request_tokens)}&oauth_token_secret=secret'.encode()
+
+        token = self._oauth_token(request, body)
+        if path.endswith('services/oauth/access_token'):
+            with self.lock:
+                user_id = self.approved.pop(token, None)
+            # A new token on every login, like USOS issues
+            access_token = f'at{user_id}.{next(self.access_tokens)}'
+            return 'text/plain', f'oauth_token={access_token}&oauth_token_secret=secret'.encode()
+
+        user_id = token[2:].split('.')[0] if token else ''
+        profile = {
+            'id': user_id,
+            'first_name': f'User{user_id}',
+            'last_name': 'Benchmark',
+            'email': f'user{user_id}@example.com',
+            'photo_urls': {'200x200': 'https://example.com/photo.jpg'},
+        }
+        return 'application/json', json.dumps(profile).encode()
+
+    @staticmethod
+    def _oauth_token(request, body):
+        match = OAUTH_TOKEN_HEADER.search(request.headers.get('Authorization', ''))
+        if match:
+            return match.group(1)
+
+        for source in (urlparse(request.path).query, body.decode(errors='replace')):
+            values = parse_qs(source).get('oauth_token')
+            if values:
+                return values[0]
+        return None
+
+
+class FakeContainerManager(FakeServer):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.containers = {}
+
+    def handle(self, request, body):
+        path = urlparse(request.path).path
+        session_id = json.loads(body or b'{}').get('session_id')
+
+        with self.lock:
+            if path.startswith('/make_container') or path.startswith('/restart_container'):
+                self.containers[session_id] = 'running'
+            elif path.startswith('/remove_container'):
+                self.containers.pop(session_id, None)
+            status = self.containers.get(session_id, 'not_created')
+
+        response = {
+            'status': status,
+            'port': 30000,
+            'password': 'benchmark',
+            'expiration_time': '2099-01-01T00:00:00',
+            'access_commands': [],
+        }
+        return 'application/json', json.dumps(response).encode()
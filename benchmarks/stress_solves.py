@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import db, User, Challenge, Solve, upsert_solve  # noqa: E402
+
+
+def hammer(app, barrier, user_id, challenge_id, submissions, times, errors):
+    with app.app_context():
+        barrier.wait()
+        for _ in range(submissions):
+            solve_time = datetime.now()
+            try:
+                upsert_solve(user_id, challenge_id, solve_time)
+                times.append(solve_time)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Submit the same solve from many threads at once')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--submissions', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'stress.db')}"
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id='1', first_name='Stress', last_name='Test', email='', photo_url=''))
+            db.session.add(Challenge(
+                id=1, number=1, edition_number=1, name='Stress', name_pl='Stress', description='',
+                description_pl='', start_date=datetime(2024, 1, 1), difficulty='Easy', flag='EE_CTF{<noise>}',
+                icon='fas fa-flag'
+            ))
+            db.session.commit()
+
+        barrier = threading.Barrier(args.threads)
+        times = []
+        errors = []
+        threads = [
+            threading.Thread(target=hammer, args=(app, barrier, '1', 1, args.submissions, times, errors))
+            for _ in range(args.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            solves = Solve.query.filter_by(user_id='1', challenge_id=1).all()
+            db.engine.dispose()
+
+    print(f"{len(times)} submissions, {len(errors)} errors, {len(solves)} solve rows")
+    assert not errors, errors[0]
+    assert len(solves) == 1, f"Expected exactly one solve, found {len(solves)}"
+    assert solves[0].solve_time == min(times), f"Stored {solves[0].solve_time}, earliest was {min(times)}"
+    print(f"OK: single solve stored with earliest time {solves[0].solve_time}")
+
+
+if __name__ == '__main__':
+    main()
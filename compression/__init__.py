@@ -0,0 +1 @@
+from .response import ResponseCompressor, COMPRESSIBLE_MIMETYPES
@@ -0,0 +1,58 @@
+import gzip
+import threading
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript', 'image/svg+xml'
+)
+
+
+class ResponseCompressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4, mimetypes=COMPRESSIBLE_MIMETYPES):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality  # Low qualities are fast enough to run on every response
+        self.mimetypes = frozenset(mimetypes)
+
+        self.lock = threading.Lock()
+        self.stats = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def compress(self, response):
+        # Files are sent as they are, with their precompressed variants, and streams must not be buffered
+        if response.direct_passthrough or response.is_streamed or response.mimetype not in self.mimetypes:
+            return response
+        if response.status_code not in (200, 201, 202) or 'Content-Encoding' in response.headers:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        accept_encodings = request.accept_encodings
+        if brotli is not None and accept_encodings['br']:
+            encoding = 'br'
+            compressed = brotli.compress(data, quality=self.brotli_quality)
+        elif accept_encodings['gzip']:
+            encoding = 'gzip'
+            compressed = gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+        else:
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+
+        with self.lock:
+            self.stats['responses'] += 1
+            self.stats['bytes_in'] += len(data)
+            self.stats['bytes_out'] += len(compressed)
+        return response
@@ -0,0 +1,8 @@
+from .client import (
+    ContainerManagerClient,
+    ContainerManagerError,
+    ContainerManagerUnavailableError,
+    ContainerManagerBusyError,
+)
+from .status import ContainerStatusHub
+from .admission import ContainerAdmission, SQLiteContainerAdmission
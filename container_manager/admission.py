@@ -0,0 +1,411 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from shared import SQLiteConnections
+
+from .client import ContainerManagerError, ContainerManagerBusyError
+
+QUEUED = 'queued'
+STARTING = 'starting'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class LaunchJob:
+    def __init__(self, session_id, image, flag, ticket):
+        self.session_id = session_id
+        self.image = image
+        self.flag = flag
+        self.ticket = ticket  # Position in the image queue, counted from the first job ever queued
+
+        self.state = QUEUED
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+
+class ContainerAdmission:
+    def __init__(self, launch, per_image=2, max_in_flight=4, max_queued=2000, initial_duration=15,
+                 result_ttl=120, on_finished=None):
+        self.launch = launch
+        self.per_image = per_image
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.initial_duration = initial_duration
+        self.result_ttl = result_ttl
+        self.on_finished = on_finished
+
+        self.lock = threading.Lock()
+        self.jobs = {}  # (session id, image) -> its latest job, so repeated clicks find the pending one
+        self.queues = {}  # Image -> deque of queued jobs
+        self.tickets = {}  # Image -> [next ticket, tickets dispatched]
+        self.in_flight = {}
+        self.total_in_flight = 0
+        self.queued = 0
+        self.durations = {}  # Image -> moving average of launch time in seconds
+        self.finished = deque()  # Finished jobs in the order they finished, for expiry
+
+        self.launched = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    def submit(self, session_id, image, flag):
+        with self.lock:
+            self._expire(time.monotonic())
+
+            job = self.jobs.get((session_id, image))
+            if job is not None and job.state in (QUEUED, STARTING):
+                self.deduplicated += 1
+                return self._describe(job)
+
+            if self.queued >= self.max_queued:
+                raise ContainerManagerBusyError('Too many containers are waiting to start, try again later')
+
+            tickets = self.tickets.setdefault(image, [0, 0])
+            job = LaunchJob(session_id, image, flag, tickets[0])
+            tickets[0] += 1
+            self.queues.setdefault(image, deque()).append(job)
+            self.jobs[(session_id, image)] = job
+            self.queued += 1
+
+            admitted = self._admit()
+            description = self._describe(job)
+
+        self._start(admitted)
+        return description
+
+    def status(self, session_id, image):
+        with self.lock:
+            job = self.jobs.get((session_id, image))
+            if job is None:
+                return None
+
+            description = self._describe(job)
+            # A finished job is reported once, later status calls go to the container manager again
+            if job.state in (DONE, FAILED):
+                del self.jobs[(session_id, image)]
+            return description
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued': self.queued,
+                'in_flight': self.total_in_flight,
+                'launched': self.launched,
+                'failed': self.failed,
+                'deduplicated': self.deduplicated,
+            }
+
+    def _describe(self, job):
+        description = {'state': job.state, 'image': job.image}
+        duration = self.durations.get(job.image, self.initial_duration)
+
+        if job.state == QUEUED:
+            position = job.ticket - self.tickets[job.image][1] + 1
+            description['position'] = position
+            description['eta'] = math.ceil(math.ceil(position / self.per_image) * duration)
+        elif job.state == STARTING:
+            description['eta'] = math.ceil(max(0, duration - (time.monotonic() - job.started_at)))
+        elif job.state == FAILED:
+            description['error'] = job.error
+
+        return description
+
+    def _admit(self):
+        # Oldest queued job first among the images that still have a free slot
+        admitted = []
+        while self.total_in_flight < self.max_in_flight:
+            candidates = [
+                queue[0] for image, queue in self.queues.items()
+                if queue and self.in_flight.get(image, 0) < self.per_image
+            ]
+            if not candidates:
+                break
+
+            job = min(candidates, key=lambda candidate: candidate.queued_at)
+            self.queues[job.image].popleft()
+            self.tickets[job.image][1] += 1
+            self.queued -= 1
+
+            self.in_flight[job.image] = self.in_flight.get(job.image, 0) + 1
+            self.total_in_flight += 1
+            job.state = STARTING
+            job.started_at = time.monotonic()
+            admitted.append(job)
+
+        return admitted
+
+    def _start(self, jobs):
+        for job in jobs:
+            threading.Thread(target=self._run, args=(job,), name='container-launch', daemon=True).start()
+
+    def _run(self, job):
+        error = None
+        try:
+            result = self.launch(job.session_id, job.image, job.flag)
+            if isinstance(result, dict) and result.get('error'):
+                error = result['error']
+        except ContainerManagerError as e:
+            error = e.message
+        except Exception:
+            logging.exception(f"Launching {job.image} for {job.session_id} failed")
+            error = 'Container could not be started'
+
+        now = time.monotonic()
+        with self.lock:
+            job.state = FAILED if error is not None else DONE
+            job.error = error
+            job.finished_at = now
+            job.flag = None
+
+            self.in_flight[job.image] -= 1
+            self.total_in_flight -= 1
+            if error is None:
+                self.launched += 1
+                duration = now - job.started_at
+                previous = self.durations.get(job.image)
+                self.durations[job.image] = duration if previous is None else 0.8 * previous + 0.2 * duration
+            else:
+                self.failed += 1
+            self.finished.append(job)
+
+            admitted = self._admit()
+
+        if self.on_finished is not None:
+            self.on_finished(job.session_id)
+        self._start(admitted)
+
+    def _expire(self, now):
+        while self.finished and now - self.finished[0].finished_at > self.result_ttl:
+            job = self.finished.popleft()
+            key = (job.session_id, job.image)
+            if self.jobs.get(key) is job:
+                del self.jobs[key]
+
+
+class SQLiteContainerAdmission:
+    # Queue and slots live in SQLite, so the limits hold across workers and any worker can report a job.
+    # A launch runs in the worker that admitted it, which is not always the one that queued it
+    def __init__(self, path, launch, per_image=2, max_in_flight=4, max_queued=2000, initial_duration=15,
+                 result_ttl=120, launch_timeout=300, admit_interval=1.0, on_finished=None):
+        self.connections = SQLiteConnections(path)
+        self.launch = launch
+        self.per_image = per_image
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.initial_duration = initial_duration
+        self.result_ttl = result_ttl
+        self.launch_timeout = launch_timeout
+        self.admit_interval = admit_interval
+        self.on_finished = on_finished
+
+        self.lock = threading.Lock()
+        self.next_admit = 0
+
+        self.launched = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS container_launches ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, image TEXT NOT NULL, flag TEXT, '
+                'state TEXT NOT NULL, queued_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_container_launches_session_image '
+                'ON container_launches (session_id, image)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_container_launches_state_image ON container_launches (state, image)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS container_launch_durations (image TEXT PRIMARY KEY, duration REAL NOT NULL)'
+            )
+
+    def submit(self, session_id, image, flag):
+        now = time.time()
+        with self.connections.transaction() as connection:
+            self._expire(connection, now)
+
+            row = connection.execute(
+                'SELECT id FROM container_launches WHERE session_id = ? AND image = ? AND state IN (?, ?)',
+                (session_id, image, QUEUED, STARTING)
+            ).fetchone()
+            if row is not None:
+                job_id = row[0]
+                with self.lock:
+                    self.deduplicated += 1
+            else:
+                queued = connection.execute(
+                    'SELECT COUNT(*) FROM container_launches WHERE state = ?', (QUEUED,)
+                ).fetchone()[0]
+                if queued >= self.max_queued:
+                    raise ContainerManagerBusyError('Too many containers are waiting to start, try again later')
+
+                job_id = connection.execute(
+                    'INSERT INTO container_launches (session_id, image, flag, state, queued_at) VALUES (?, ?, ?, ?, ?)',
+                    (session_id, image, flag, QUEUED, now)
+                ).lastrowid
+
+            admitted = self._admit(connection, now)
+            description = self._describe(connection, job_id, now)
+
+        self._start(admitted)
+        return description
+
+    def status(self, session_id, image):
+        now = time.time()
+        # Admission also runs here now and then, so slots of a worker that died are handed out again
+        with self.lock:
+            admit = now >= self.next_admit
+            if admit:
+                self.next_admit = now + self.admit_interval
+        if admit:
+            with self.connections.transaction() as connection:
+                admitted = self._admit(connection, now)
+            self._start(admitted)
+
+        connection = self.connections.connection()
+        row = connection.execute(
+            'SELECT id, state FROM container_launches WHERE session_id = ? AND image = ? ORDER BY id DESC LIMIT 1',
+            (session_id, image)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job_id, state = row
+        description = self._describe(connection, job_id, now)
+        # A finished job is reported once, later status calls go to the container manager again
+        if state in (DONE, FAILED):
+            connection.execute('DELETE FROM container_launches WHERE id = ?', (job_id,))
+        return description
+
+    def stats(self):
+        counts = dict(self.connections.execute(
+            'SELECT state, COUNT(*) FROM container_launches WHERE state IN (?, ?) GROUP BY state', (QUEUED, STARTING)
+        ).fetchall())
+        with self.lock:
+            return {
+                'queued': counts.get(QUEUED, 0),
+                'in_flight': counts.get(STARTING, 0),
+                'launched': self.launched,
+                'failed': self.failed,
+                'deduplicated': self.deduplicated,
+            }
+
+    def _duration(self, connection, image):
+        row = connection.execute(
+            'SELECT duration FROM container_launch_durations WHERE image = ?', (image,)
+        ).fetchone()
+        return row[0] if row is not None else self.initial_duration
+
+    def _describe(self, connection, job_id, now):
+        state, image, started_at, error = connection.execute(
+            'SELECT state, image, started_at, error FROM container_launches WHERE id = ?', (job_id,)
+        ).fetchone()
+        description = {'state': state, 'image': image}
+        duration = self._duration(connection, image)
+
+        if state == QUEUED:
+            position = connection.execute(
+                'SELECT COUNT(*) FROM container_launches WHERE state = ? AND image = ? AND id <= ?',
+                (QUEUED, image, job_id)
+            ).fetchone()[0]
+            description['position'] = position
+            description['eta'] = math.ceil(math.ceil(position / self.per_image) * duration)
+        elif state == STARTING:
+            description['eta'] = math.ceil(max(0, duration - (now - started_at)))
+        elif state == FAILED:
+            description['error'] = error
+
+        return description
+
+    def _admit(self, connection, now):
+        # A launch still starting after the timeout belongs to a worker that died, its slot is freed
+        connection.execute(
+            'UPDATE container_launches SET state = ?, error = ?, finished_at = ?, flag = NULL '
+            'WHERE state = ? AND started_at < ?',
+            (FAILED, 'Container could not be started', now, STARTING, now - self.launch_timeout)
+        )
+
+        in_flight = dict(connection.execute(
+            'SELECT image, COUNT(*) FROM container_launches WHERE state = ? GROUP BY image', (STARTING,)
+        ).fetchall())
+        total_in_flight = sum(in_flight.values())
+        if total_in_flight >= self.max_in_flight:
+            return []
+
+        # Oldest queued job first among the images that still have a free slot
+        admitted = []
+        queued = connection.execute(
+            'SELECT id, session_id, image, flag FROM container_launches WHERE state = ? ORDER BY id', (QUEUED,)
+        ).fetchall()
+        for job_id, session_id, image, flag in queued:
+            if total_in_flight >= self.max_in_flight:
+                break
+            if in_flight.get(image, 0) >= self.per_image:
+                continue
+
+            in_flight[image] = in_flight.get(image, 0) + 1
+            total_in_flight += 1
+            connection.execute(
+                'UPDATE container_launches SET state = ?, started_at = ? WHERE id = ?', (STARTING, now, job_id)
+            )
+            admitted.append((job_id, session_id, image, flag, now))
+
+        return admitted
+
+    def _start(self, jobs):
+        for job in jobs:
+            threading.Thread(target=self._run, args=job, name='container-launch', daemon=True).start()
+
+    def _run(self, job_id, session_id, image, flag, started_at):
+        error = None
+        try:
+            result = self.launch(session_id, image, flag)
+            if isinstance(result, dict) and result.get('error'):
+                error = result['error']
+        except ContainerManagerError as e:
+            error = e.message
+        except Exception:
+            logging.exception(f"Launching {image} for {session_id} failed")
+            error = 'Container could not be started'
+
+        now = time.time()
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'UPDATE container_launches SET state = ?, error = ?, finished_at = ?, flag = NULL WHERE id = ?',
+                (FAILED if error is not None else DONE, error, now, job_id)
+            )
+            if error is None:
+                duration = now - started_at
+                previous = connection.execute(
+                    'SELECT duration FROM container_launch_durations WHERE image = ?', (image,)
+                ).fetchone()
+                connection.execute(
+                    'INSERT OR REPLACE INTO container_launch_durations (image, duration) VALUES (?, ?)',
+                    (image, duration if previous is None else 0.8 * previous[0] + 0.2 * duration)
+                )
+
+            admitted = self._admit(connection, now)
+
+        with self.lock:
+            if error is None:
+                self.launched += 1
+            else:
+                self.failed += 1
+
+        if self.on_finished is not None:
+            self.on_finished(session_id)
+        self._start(admitted)
+
+    def _expire(self, connection, now):
+        connection.execute(
+            'DELETE FROM container_launches WHERE state IN (?, ?) AND finished_at < ?',
+            (DONE, FAILED, now - self.result_ttl)
+        )
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUTS = {
+    'container_status': (2, 5),
+    'make_container': (2, 60),
+    'remove_container': (2, 30),
+    'extend_container': (2, 10),
+    'restart_container': (2, 60),
+    'prepare_image': (2, 30),
+}
+
+
+class ContainerManagerError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ContainerManagerUnavailableError(ContainerManagerError):
+    pass
+
+
+class ContainerManagerBusyError(ContainerManagerError):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_progress = False
+
+            if self.state == self.HALF_OPEN and not self.trial_in_progress:
+                self.trial_in_progress = True
+                return True
+
+            return False
+
+    def cancel_request(self):
+        # An allowed call that never went out, a half open breaker lets the next one try instead
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_in_progress = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ContainerManagerClient:
+    def __init__(self, api_address, secret_key, pool_size=16, max_concurrency=16, acquire_timeout=1,
+                 timeouts=None, failure_threshold=5, reset_timeout=30, observer=None):
+        self.api_address = api_address.rstrip('/')
+        self.observer = observer
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.acquire_timeout = acquire_timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            'X-Secret-Key': secret_key,
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def container_status(self, session_id, image):
+        return self._call('container_status', 'POST', f'/container_status/{image}', {'session_id': session_id})
+
+    def make_container(self, session_id, image, flag):
+        return self._call('make_container', 'POST', f'/make_container/{image}', {'session_id': session_id, 'flag': flag})
+
+    def remove_container(self, session_id):
+        return self._call('remove_container', 'DELETE', '/remove_container', {'session_id': session_id})
+
+    def extend_container(self, session_id):
+        return self._call('extend_container', 'POST', '/extend_container', {'session_id': session_id})
+
+    def restart_container(self, session_id):
+        return self._call('restart_container', 'POST', '/restart_container', {'session_id': session_id})
+
+    def prepare_image(self, image, warm_pool):
+        # Pulls the image and starts warm_pool idle containers, so the first launches after a release are quick
+        return self._call('prepare_image', 'POST', f'/prepare_image/{image}', {'warm_pool': warm_pool})
+
+    def _call(self, operation, method, path, payload):
+        # The breaker goes first, while it is open calls fail at once instead of waiting for a slot
+        if not self.breaker.allow_request():
+            raise ContainerManagerUnavailableError('Container manager is unavailable, try again later')
+
+        if not self.slots.acquire(timeout=self.acquire_timeout):
+            self.breaker.cancel_request()
+            raise ContainerManagerBusyError('Container manager is busy, try again later')
+
+        started_at = time.perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                self.api_address + path,
+                json=payload,
+                timeout=self.timeouts[operation]
+            )
+        except requests.RequestException:
+            self.breaker.record_failure()
+            self._observe(operation, started_at, True)
+            raise ContainerManagerUnavailableError('Container manager is unavailable, try again later')
+        finally:
+            self.slots.release()
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self._observe(operation, started_at, response.status_code >= 500)
+
+        try:
+            return response.json()
+        except ValueError:
+            raise ContainerManagerError('Invalid response from container manager')
+
+    def _observe(self, operation, started_at, failed):
+        if self.observer is not None:
+            self.observer(operation, time.perf_counter() - started_at, failed)
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .client import ContainerManagerError
+
+
+class ContainerStatusHub:
+    def __init__(self, fetch_status, ttl=10, max_streams=4, max_entries=10_000, max_idle=300):
+        self.fetch_status = fetch_status
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_idle = max_idle
+
+        self.entries = OrderedDict()  # (session_id, image) -> entry, least recently used first
+        self.sessions = {}  # session_id -> images with an entry
+        self.subscribers = {}  # (session_id, image) -> open streams
+        self.refreshing = set()
+        self.condition = threading.Condition()
+        self.streams = threading.BoundedSemaphore(max_streams)
+        self.open_streams = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_status(self, session_id, image):
+        status, _version = self._get((session_id, image))
+        return status
+
+    def invalidate(self, session_id):
+        with self.condition:
+            for image in self.sessions.get(session_id, ()):
+                self.entries[(session_id, image)]['fetched_at'] = 0
+            self.condition.notify_all()
+
+    def _get(self, key):
+        with self.condition:
+            while True:
+                entry = self.entries.get(key)
+                now = time.monotonic()
+                if entry is not None and now - entry['fetched_at'] < self.ttl:
+                    entry['used_at'] = now
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['status'], entry['version']
+
+                if key not in self.refreshing:
+                    self.refreshing.add(key)
+                    self.misses += 1
+                    break
+
+                self.condition.wait()
+
+        try:
+            status = self.fetch_status(*key)
+        except Exception:
+            with self.condition:
+                self.refreshing.discard(key)
+                self.condition.notify_all()
+            raise
+
+        with self.condition:
+            self.refreshing.discard(key)
+            previous = self.entries.get(key)
+            version = previous['version'] if previous is not None else 0
+            if previous is None or previous['status'] != status:
+                version += 1
+            now = time.monotonic()
+            self.entries[key] = {'status': status, 'fetched_at': now, 'used_at': now, 'version': version}
+            self.entries.move_to_end(key)
+            self.sessions.setdefault(key[0], set()).add(key[1])
+            self._evict(now)
+            self.condition.notify_all()
+
+        return status, version
+
+    def _evict(self, now):
+        # Least recently used first, until the rest is recent and within the limit.
+        # Entries with an open stream are in use, they are moved back instead
+        skipped = 0
+        while self.entries and skipped < len(self.entries):
+            key, entry = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and now - entry['used_at'] < self.max_idle:
+                break
+            if self.subscribers.get(key):
+                entry['used_at'] = now
+                self.entries.move_to_end(key)
+                skipped += 1
+                continue
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self.entries[key]
+        images = self.sessions[key[0]]
+        images.discard(key[1])
+        if not images:
+            del self.sessions[key[0]]
+
+    def _subscribe(self, key):
+        with self.condition:
+            self.subscribers[key] = self.subscribers.get(key, 0) + 1
+
+    def _unsubscribe(self, key):
+        # The last stream for a status takes its entry along, a later page load fetches it again
+        with self.condition:
+            count = self.subscribers.pop(key) - 1
+            if count:
+                self.subscribers[key] = count
+            elif key in self.entries:
+                self._remove(key)
+
+    def _wait_for_change(self, key, version, timeout):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                entry = self.entries.get(key)
+                if entry is None or entry['version'] != version or entry['fetched_at'] == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.condition.wait(remaining)
+
+    def open_stream(self):
+        if not self.streams.acquire(blocking=False):
+            return False
+        with self.condition:
+            self.open_streams += 1
+        return True
+
+    def close_stream(self):
+        with self.condition:
+            self.open_streams -= 1
+        self.streams.release()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'entries': len(self.entries),
+                'sessions': len(self.sessions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'streams': self.open_streams,
+            }
+
+    def stream(self, session_id, image, lifetime=30, poll_interval=10, retry=3000):
+        key = (session_id, image)
+        deadline = time.monotonic() + lifetime
+        version = None
+
+        self._subscribe(key)
+        try:
+            yield f'retry: {retry}\n\n'
+            while True:
+                status, new_version = self._get(key)
+                if new_version != version:
+                    version = new_version
+                    yield f'data: {json.dumps(status)}\n\n'
+                else:
+                    yield ': keepalive\n\n'
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wait_for_change(key, version, min(poll_interval, remaining))
+        except ContainerManagerError as e:
+            yield f'event: error\ndata: {json.dumps({"error": e.message})}\n\n'
+        finally:
+            self._unsubscribe(key)
@@ -0,0 +1 @@
+from .store import DownloadStore, StoredFile, OFFLOAD_MODES
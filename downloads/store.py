@@ -0,0 +1,221 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import stat
+import threading
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+VARIANT_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))  # In order of preference
+OFFLOAD_MODES = ('x-accel-redirect', 'x-sendfile')
+
+
+class StoredFile:
+    def __init__(self, relative_path, path, size, mtime_ns, etag, mimetype, variants):
+        self.relative_path = relative_path
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.etag = etag
+        self.mimetype = mimetype
+        self.variants = variants  # Encoding -> path of the compressed file
+
+    @property
+    def last_modified(self):
+        return self.mtime_ns / 1e9
+
+    def matches(self, file_stat):
+        return self.size == file_stat.st_size and self.mtime_ns == file_stat.st_mtime_ns
+
+
+class DownloadStore:
+    def __init__(self, root, compressed_dir=None, max_compressed_size=64 * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.compressed_dir = compressed_dir
+        self.max_compressed_size = max_compressed_size
+
+        self.files = {}
+        self.indexing = set()
+        self.compressing = set()
+        self.condition = threading.Condition()
+
+        self.hashed_bytes = 0
+
+    def lookup(self, filename):
+        path = safe_join(self.root, filename)
+        if path is None:
+            return None
+
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+
+        # Content hashes are computed once per file version, concurrent requests wait for the first one
+        with self.condition:
+            while True:
+                stored = self.files.get(path)
+                if stored is not None and stored.matches(file_stat):
+                    return stored
+
+                if path not in self.indexing:
+                    self.indexing.add(path)
+                    break
+
+                self.condition.wait()
+
+        stored = None
+        try:
+            stored = self._index(os.path.relpath(path, self.root), path, file_stat)
+        finally:
+            with self.condition:
+                self.indexing.discard(path)
+                if stored is not None:
+                    self.files[path] = stored
+                self.condition.notify_all()
+
+        self._schedule_compression(stored)
+        return stored
+
+    def warm(self, skip=()):
+        skipped = {os.path.join(self.root, path) for path in skip}
+        for directory, dirs, filenames in os.walk(self.root):
+            dirs[:] = [name for name in dirs if os.path.join(directory, name) not in skipped]
+            for filename in filenames:
+                self.lookup(os.path.relpath(os.path.join(directory, filename), self.root))
+
+    def stats(self):
+        with self.condition:
+            return {
+                'files': len(self.files),
+                'variants': sum(len(stored.variants) for stored in self.files.values()),
+                'hashed_bytes': self.hashed_bytes,
+            }
+
+    def negotiate(self, stored, accept_encodings, within_root=False):
+        variants = stored.variants
+        for encoding, _suffix in VARIANT_SUFFIXES:
+            path = variants.get(encoding)
+            if path is None or not accept_encodings[encoding]:
+                continue
+            if within_root and not path.startswith(self.root + os.sep):
+                continue
+            return encoding, path
+
+        return None, stored.path
+
+    def send(self, filename, max_age=None, offload=None, accel_prefix='/', immutable=False):
+        stored = self.lookup(filename)
+        if stored is None:
+            abort(404)
+
+        encoding, path = self.negotiate(stored, request.accept_encodings, within_root=offload == 'x-accel-redirect')
+        etag = stored.etag if encoding is None else f'{stored.etag}-{encoding}'
+
+        if offload is None:
+            response = send_file(path, mimetype=stored.mimetype, etag=etag, last_modified=stored.last_modified,
+                                 max_age=max_age)
+        else:
+            # The front proxy streams the file, we only answer revalidations ourselves
+            response = Response(mimetype=stored.mimetype)
+            response.set_etag(etag)
+            response.last_modified = stored.last_modified
+            if max_age is not None:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+            if offload == 'x-accel-redirect':
+                response.headers['X-Accel-Redirect'] = accel_prefix + quote(os.path.relpath(path, self.root))
+            else:
+                response.headers['X-Sendfile'] = path
+            response = response.make_conditional(request)
+
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if stored.variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def _index(self, relative_path, path, file_stat):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()[:32]
+
+        with self.condition:
+            self.hashed_bytes += file_stat.st_size
+
+        mimetype, file_encoding = mimetypes.guess_type(path)
+        if mimetype is None or file_encoding is not None:
+            mimetype = 'application/octet-stream'
+
+        # Only variants the store wrote itself, a .gz next to a file may be an attachment of its own
+        variants = {}
+        if self.compressed_dir is not None:
+            for encoding, suffix in VARIANT_SUFFIXES:
+                cached = os.path.join(self.compressed_dir, etag + suffix)
+                if os.path.isfile(cached):
+                    variants[encoding] = cached
+
+        return StoredFile(relative_path, path, file_stat.st_size, file_stat.st_mtime_ns, etag, mimetype, variants)
+
+    def _schedule_compression(self, stored):
+        if self.compressed_dir is None or stored is None:
+            return
+        if stored.size > self.max_compressed_size or not stored.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return
+        if all(encoding in stored.variants for encoding in self._encodings()):
+            return
+
+        with self.condition:
+            if stored.etag in self.compressing:
+                return
+            self.compressing.add(stored.etag)
+
+        threading.Thread(target=self._compress, args=(stored,), name='download-compressor', daemon=True).start()
+
+    def _encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def _compress(self, stored):
+        try:
+            os.makedirs(self.compressed_dir, exist_ok=True)
+            for encoding in self._encodings():
+                if encoding in stored.variants:
+                    continue
+
+                suffix = dict(VARIANT_SUFFIXES)[encoding]
+                target = os.path.join(self.compressed_dir, stored.etag + suffix)
+                temporary = f'{target}.{threading.get_ident()}.tmp'
+                with open(stored.path, 'rb') as source, open(temporary, 'wb') as output:
+                    if encoding == 'gzip':
+                        with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0) as compressed:
+                            shutil.copyfileobj(source, compressed)
+                    else:
+                        output.write(brotli.compress(source.read()))
+                os.replace(temporary, target)
+
+                # Only worth serving when it is actually smaller
+                if os.path.getsize(target) < stored.size:
+                    stored.variants = dict(stored.variants, **{encoding: target})
+                else:
+                    os.remove(target)
+        finally:
+            with self.condition:
+                self.compressing.discard(stored.etag)
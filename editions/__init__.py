@@ -0,0 +1,4 @@
+from .current import CurrentEdition
+from .exporter import export_edition, EXPORT_KINDS, EXPORT_FORMATS
+from .importer import load_edition, import_edition, EditionImportError
+from .archive import archive_edition, EditionArchive, ArchivedEdition, EditionArchiveError
@@ -0,0 +1,238 @@
+import logging
+import os
+import re
+import threading
+
+from sqlalchemy import create_engine, event, func, insert, select, delete
+from sqlalchemy.orm import sessionmaker
+
+from model import db, User, Challenge, Solve, Rating, Comment
+from scoreboard import Scoreboard, ChallengeStatistics
+
+ARCHIVE_FILENAME = 'edition-{}.db'
+ARCHIVE_FILENAME_PATTERN = re.compile(r'^edition-(\d+)\.db$')
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_PRAGMAS = (
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16 * 1024),  # Negative value is in KiB
+    ('temp_store', 'MEMORY'),
+)
+
+# Users are shared between editions, they are copied for the names but stay in the live database
+ARCHIVED_MODELS = (User, Challenge, Solve, Rating, Comment)
+FEEDBACK_MODELS = (Solve, Rating, Comment)
+
+
+class EditionArchiveError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+def archive_path(directory, edition_number):
+    return os.path.join(directory, ARCHIVE_FILENAME.format(edition_number))
+
+
+def set_archive_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in ARCHIVE_PRAGMAS:
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+def _edition_statements(edition_number):
+    challenge_ids = select(Challenge.id).where(Challenge.edition_number == edition_number)
+    feedback = {
+        model: select(model.__table__).where(model.challenge_id.in_(challenge_ids)).order_by(model.id)
+        for model in FEEDBACK_MODELS
+    }
+    user_ids = select(Solve.user_id).where(Solve.challenge_id.in_(challenge_ids)).union(
+        select(Rating.user_id).where(Rating.challenge_id.in_(challenge_ids)),
+        select(Comment.user_id).where(Comment.challenge_id.in_(challenge_ids))
+    )
+    return {
+        User: select(User.__table__).where(User.id.in_(user_ids)).order_by(User.id),
+        Challenge: select(Challenge.__table__).where(Challenge.edition_number == edition_number).order_by(Challenge.id),
+        **feedback,
+    }
+
+
+def _copy_rows(statement, target, table, batch_size):
+    # Streamed in batches, a large edition is never loaded whole
+    result = db.session.execute(statement, execution_options={'yield_per': batch_size})
+    count = 0
+    for rows in result.partitions():
+        target.execute(insert(table), [dict(row._mapping) for row in rows])
+        count += len(rows)
+    return count
+
+
+def _write_archive(edition_number, path, batch_size):
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        tables = [model.__table__ for model in ARCHIVED_MODELS]
+        db.metadata.create_all(engine, tables=tables)
+
+        counts = {}
+        with engine.begin() as target:
+            for model, statement in _edition_statements(edition_number).items():
+                counts[model] = _copy_rows(statement, target, model.__table__, batch_size)
+
+        # Compacted and analyzed once, the file is never written again
+        with engine.connect() as target:
+            target.exec_driver_sql('ANALYZE')
+            target.exec_driver_sql('VACUUM')
+    finally:
+        engine.dispose()
+
+    return counts
+
+
+def _delete_edition(edition_number, counts):
+    # Deleted only if nothing was added since the copy, otherwise the archive would miss it
+    challenge_ids = select(Challenge.id).where(Challenge.edition_number == edition_number)
+    try:
+        for model in FEEDBACK_MODELS:
+            live_count = db.session.scalar(
+                select(func.count()).select_from(model).where(model.challenge_id.in_(challenge_ids))
+            )
+            if live_count != counts[model]:
+                raise EditionArchiveError(f"Edition {edition_number} changed while it was archived, try again")
+
+        for model in FEEDBACK_MODELS:
+            db.session.execute(delete(model).where(model.challenge_id.in_(challenge_ids)))
+        deleted = db.session.execute(delete(Challenge).where(Challenge.edition_number == edition_number)).rowcount
+        if deleted != counts[Challenge]:
+            raise EditionArchiveError(f"Edition {edition_number} changed while it was archived, try again")
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def archive_edition(edition_number, directory, batch_size=ARCHIVE_BATCH_SIZE):
+    path = archive_path(directory, edition_number)
+    if os.path.exists(path):
+        raise EditionArchiveError(f"Edition {edition_number} is already archived in {path}")
+
+    challenge_count = db.session.scalar(
+        select(func.count()).select_from(Challenge).where(Challenge.edition_number == edition_number)
+    )
+    if not challenge_count:
+        raise EditionArchiveError(f"Edition {edition_number} has no challenges in the database")
+
+    # Written next to the final file and renamed, readers never see a half written archive
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = path + '.tmp'
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+    try:
+        counts = _write_archive(edition_number, temporary_path, batch_size)
+        os.chmod(temporary_path, 0o444)
+        os.replace(temporary_path, path)
+    except Exception:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    try:
+        _delete_edition(edition_number, counts)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return {model.__tablename__: count for model, count in counts.items()}
+
+
+class ArchivedEdition:
+    def __init__(self, edition_number, path, top_size=5):
+        self.edition_number = edition_number
+        self.path = path
+        self.top_size = top_size
+
+        # Never written again, so SQLite can skip locking and change detection altogether
+        self.engine = create_engine(
+            f'sqlite:///file:{path}?mode=ro&immutable=1&uri=true',
+            connect_args={'check_same_thread': False}
+        )
+        event.listen(self.engine, 'connect', set_archive_pragmas)
+        self.sessions = sessionmaker(bind=self.engine)
+
+        self.lock = threading.Lock()
+        self._scoreboard = None
+        self._statistics = None
+
+    def session(self):
+        return self.sessions()
+
+    def scoreboard(self):
+        # The data never changes, so it is built on first use and kept
+        with self.lock:
+            if self._scoreboard is None:
+                board = Scoreboard(top_size=self.top_size)
+                with self.session() as session:
+                    board.rebuild(
+                        session.query(Challenge.id, Challenge.edition_number).all(),
+                        session.query(User.id, User.first_name, User.last_name).all(),
+                        session.query(Solve.id, Solve.user_id, Solve.challenge_id, Solve.solve_time).all()
+                    )
+                self._scoreboard = board
+            return self._scoreboard
+
+    def statistics(self):
+        with self.lock:
+            if self._statistics is None:
+                statistics = ChallengeStatistics()
+                with self.session() as session:
+                    statistics.rebuild(
+                        session.query(Challenge.id, Challenge.edition_number, Challenge.start_date).all(),
+                        session.query(Solve.user_id, Solve.challenge_id, Solve.solve_time).all(),
+                        session.query(Rating.user_id, Rating.challenge_id, Rating.rating).all(),
+                        session.query(Comment.user_id, Comment.challenge_id).all()
+                    )
+                self._statistics = statistics
+            return self._statistics
+
+    def close(self):
+        self.engine.dispose()
+
+
+class EditionArchive:
+    def __init__(self, directory, top_size=5):
+        self.directory = directory
+        self.top_size = top_size
+
+        self.lock = threading.Lock()
+        self.editions = {}
+
+    def refresh(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            filenames = []
+
+        found = {}
+        for filename in filenames:
+            match = ARCHIVE_FILENAME_PATTERN.match(filename)
+            if match:
+                found[int(match.group(1))] = os.path.join(self.directory, filename)
+
+        added = []
+        with self.lock:
+            for edition_number, path in found.items():
+                if edition_number not in self.editions:
+                    self.editions[edition_number] = ArchivedEdition(edition_number, path, top_size=self.top_size)
+                    added.append(edition_number)
+                    logging.info(f"Serving edition {edition_number} from the archive {path}")
+            for edition_number in set(self.editions) - set(found):
+                self.editions.pop(edition_number).close()
+
+        return added
+
+    def get(self, edition_number):
+        return self.editions.get(edition_number)
+
+    def edition_numbers(self):
+        return sorted(self.editions)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class CurrentEdition:
+    def __init__(self, loader, refresh_interval=30, on_change=None):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+
+        self.lock = threading.Lock()
+        self.value = None
+        self.next_refresh = 0
+
+    def get(self):
+        # Re-read now and then, so an edition switched from the CLI is picked up without a restart.
+        # Only one thread reloads, the others keep using the previous value meanwhile
+        now = time.monotonic()
+        if now >= self.next_refresh:
+            with self.lock:
+                due = now >= self.next_refresh
+                if due:
+                    self.next_refresh = now + self.refresh_interval
+            if due:
+                self._set(self.loader())
+
+        return self.value
+
+    def refresh(self):
+        value = self.loader()
+        with self.lock:
+            self.next_refresh = time.monotonic() + self.refresh_interval
+        self._set(value)
+        return value
+
+    def _set(self, value):
+        previous, self.value = self.value, value
+        if value != previous and self.on_change is not None:
+            self.on_change(value)
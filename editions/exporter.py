@@ -0,0 +1,59 @@
+import csv
+import json
+
+from sqlalchemy import select
+
+from model import db, User, Challenge, Solve, Rating, Comment
+
+EXPORT_KINDS = ('solves', 'ratings', 'comments')
+EXPORT_FORMATS = ('csv', 'jsonl')
+STREAM_BATCH_SIZE = 1000
+
+
+def _export_statements(edition_number):
+    def for_edition(model, *columns):
+        return (select(*columns)
+                .join(Challenge, model.challenge_id == Challenge.id)
+                .join(User, model.user_id == User.id)
+                .where(Challenge.edition_number == edition_number)
+                .order_by(model.id))
+
+    return {
+        'solves': for_edition(
+            Solve, Solve.id, Challenge.number.label('challenge_number'), Solve.user_id, User.first_name,
+            User.last_name, Solve.solve_time
+        ),
+        'ratings': for_edition(
+            Rating, Rating.id, Challenge.number.label('challenge_number'), Rating.user_id, Rating.rating
+        ),
+        'comments': for_edition(
+            Comment, Comment.id, Challenge.number.label('challenge_number'), Comment.user_id, User.first_name,
+            User.last_name, Comment.comment
+        ),
+    }
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def export_edition(kind, edition_number, output, export_format='csv', batch_size=STREAM_BATCH_SIZE, session=None):
+    # Rows are fetched and written in batches, the table is never loaded whole
+    statement = _export_statements(edition_number)[kind]
+    session = session if session is not None else db.session
+    result = session.execute(statement, execution_options={'yield_per': batch_size})
+    columns = list(result.keys())
+
+    count = 0
+    if export_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for row in result:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in result:
+            output.write(json.dumps(dict(zip(columns, row)), default=_json_value, ensure_ascii=False) + '\n')
+            count += 1
+
+    return count
@@ -0,0 +1,150 @@
+import json
+import os
+from datetime import datetime
+
+from model import db, Challenge
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# JSONDecodeError and UnicodeDecodeError are both ValueErrors
+PARSE_ERRORS = (ValueError, yaml.YAMLError) if yaml is not None else (ValueError,)
+CHALLENGE_EXTENSIONS = ('.json', '.yaml', '.yml')
+TEXT_FIELDS = ('name', 'name_pl', 'description', 'description_pl', 'flag', 'icon')
+DIFFICULTIES = tuple(Challenge.difficulty.type.enums)
+
+
+class EditionImportError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+def parse_challenge_file(path, extension):
+    with open(path, encoding='utf-8') as file:
+        if extension == '.json':
+            return json.load(file)
+        if yaml is None:
+            raise EditionImportError(f"{path}: PyYAML is needed to read YAML files")
+        return yaml.safe_load(file)
+
+
+def read_challenge_files(directory):
+    # Every file holds one challenge or a list of them
+    documents = []
+    errors = []
+    for filename in sorted(os.listdir(directory)):
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in CHALLENGE_EXTENSIONS:
+            continue
+
+        path = os.path.join(directory, filename)
+        try:
+            content = parse_challenge_file(path, extension)
+        except PARSE_ERRORS as e:
+            errors.append(f"{path}: could not be parsed: {e}")
+            continue
+
+        for position, data in enumerate(content if isinstance(content, list) else [content]):
+            documents.append((filename if not isinstance(content, list) else f"{filename}[{position}]", data))
+
+    return documents, errors
+
+
+def validate_challenge(source, data):
+    if not isinstance(data, dict):
+        return None, [f"{source}: expected a mapping of challenge fields"]
+
+    errors = []
+    challenge = {}
+
+    number = data.get('number')
+    if not isinstance(number, int) or isinstance(number, bool) or number < 1:
+        errors.append(f"{source}: number must be a positive integer")
+    challenge['number'] = number
+
+    for field in TEXT_FIELDS:
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{source}: {field} must be a non-empty string")
+        challenge[field] = value
+
+    difficulty = data.get('difficulty')
+    if difficulty not in DIFFICULTIES:
+        errors.append(f"{source}: difficulty must be one of {', '.join(DIFFICULTIES)}")
+    challenge['difficulty'] = difficulty
+
+    start_date = data.get('start_date')
+    if isinstance(start_date, str):
+        try:
+            start_date = datetime.fromisoformat(start_date)
+        except ValueError:
+            start_date = None
+    if not isinstance(start_date, datetime):
+        errors.append(f"{source}: start_date must be a date and time like 2024-03-01T18:00:00")
+    challenge['start_date'] = start_date
+
+    unknown = set(data) - set(TEXT_FIELDS) - {'number', 'difficulty', 'start_date'}
+    if unknown:
+        errors.append(f"{source}: unknown fields {', '.join(sorted(unknown))}")
+
+    return challenge, errors
+
+
+def load_edition(directory):
+    documents, errors = read_challenge_files(directory)
+    if not documents and not errors:
+        raise EditionImportError(f"No challenge files ({', '.join(CHALLENGE_EXTENSIONS)}) in {directory}")
+
+    challenges = []
+    sources = {}
+    for source, data in documents:
+        challenge, challenge_errors = validate_challenge(source, data)
+        errors.extend(challenge_errors)
+        if challenge_errors:
+            continue
+
+        number = challenge['number']
+        if number in sources:
+            errors.append(f"{source}: number {number} is already used by {sources[number]}")
+            continue
+        sources[number] = source
+        challenges.append(challenge)
+
+    if errors:
+        raise EditionImportError('\n'.join(errors))
+
+    return sorted(challenges, key=lambda challenge: challenge['number'])
+
+
+def import_edition(edition_number, challenges):
+    # Existing challenges are updated in place, so their ids and solves are kept
+    existing = {
+        challenge.number: challenge
+        for challenge in Challenge.query.filter_by(edition_number=edition_number)
+    }
+
+    created = updated = 0
+    try:
+        for fields in challenges:
+            challenge = existing.get(fields['number'])
+            if challenge is None:
+                db.session.add(Challenge(edition_number=edition_number, **fields))
+                created += 1
+                continue
+
+            changed = False
+            for field, value in fields.items():
+                if getattr(challenge, field) != value:
+                    setattr(challenge, field, value)
+                    changed = True
+            updated += changed
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return created, updated
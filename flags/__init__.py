@@ -0,0 +1,2 @@
+from .engine import FlagEngine, normalize_flag
+from .leaks import LeakIndex
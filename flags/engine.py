@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_flag(submitted_flag):
+    # Pasted flags often come with surrounding whitespace, checks and leak lookups ignore it alike
+    return submitted_flag.strip() if submitted_flag is not None else None
+
+
+class FlagEngine:
+    def __init__(self, template_loader, default_template, noise_tag, noise_length, cache_size=10_000,
+                 missing_ttl=30):
+        self.template_loader = template_loader
+        self.default_template = default_template
+        self.noise_tag = noise_tag
+        self.noise_length = noise_length
+        self.cache_size = cache_size
+        self.missing_ttl = missing_ttl
+
+        self.templates = {}
+        self.missing = OrderedDict()  # Challenge id -> when the miss expires, unknown ids skip the database too
+        self.templates_lock = threading.Lock()
+
+        self.flags = OrderedDict()
+        self.flags_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, templates):
+        templates = dict(templates)
+        with self.templates_lock:
+            self.templates.update(templates)
+            for challenge_id in templates:
+                self.missing.pop(challenge_id, None)
+
+    def clear(self):
+        with self.templates_lock:
+            self.templates.clear()
+            self.missing.clear()
+
+    def invalidate(self, challenge_id):
+        with self.templates_lock:
+            self.templates.pop(challenge_id, None)
+            self.missing.pop(challenge_id, None)
+
+    def get_template(self, challenge_id):
+        if challenge_id is None:
+            return self.default_template
+
+        template = self.templates.get(challenge_id)
+        if template is not None:
+            return template
+
+        now = time.monotonic()
+        with self.templates_lock:
+            expires_at = self.missing.get(challenge_id)
+            if expires_at is not None and now < expires_at:
+                return None
+
+        template = self.template_loader(challenge_id)
+        with self.templates_lock:
+            if template is not None:
+                self.templates[challenge_id] = template
+                self.missing.pop(challenge_id, None)
+            else:
+                self.missing[challenge_id] = now + self.missing_ttl
+                self.missing.move_to_end(challenge_id)
+                if len(self.missing) > self.cache_size:
+                    self.missing.popitem(last=False)
+
+        return template
+
+    def noise(self, user_id, template):
+        text_to_encode = f"secret_{user_id}_{template}"
+        return hashlib.sha256(text_to_encode.encode()).hexdigest()[:self.noise_length]
+
+    def derive(self, user_id, template):
+        return template.replace(self.noise_tag, self.noise(user_id, template))
+
+    def flag_for(self, user_id, challenge_id):
+        template = self.get_template(challenge_id)
+        if template is None:
+            return None
+
+        key = (user_id, challenge_id)
+        with self.flags_lock:
+            cached = self.flags.get(key)
+            if cached is not None and cached[0] == template:
+                self.flags.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        flag = self.derive(user_id, template)
+
+        with self.flags_lock:
+            self.flags[key] = (template, flag)
+            self.flags.move_to_end(key)
+            if len(self.flags) > self.cache_size:
+                self.flags.popitem(last=False)
+
+        return flag
+
+    def stats(self):
+        with self.flags_lock:
+            return {'entries': len(self.flags), 'hits': self.hits, 'misses': self.misses}
+
+    def check(self, user_id, challenge_id, submitted_flag):
+        flag = self.flag_for(user_id, challenge_id)
+        submitted_flag = normalize_flag(submitted_flag)
+        if flag is None or submitted_flag is None:
+            return False
+
+        return hmac.compare_digest(submitted_flag.encode(), flag.encode())
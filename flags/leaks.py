@@ -0,0 +1,115 @@
+import re
+import threading
+
+from .engine import normalize_flag
+
+
+class LeakIndex:
+    def __init__(self, noise, noise_tag, noise_length):
+        self.noise = noise
+        self.noise_tag = noise_tag
+        self.noise_length = noise_length
+
+        self.lock = threading.Lock()
+        self.user_ids = set()
+        self.templates = {}
+        self.patterns = {}  # Challenge id -> pattern extracting the noise from a submitted flag
+        self.owners = {}  # Challenge id -> {noise as int: user id}, ints keep 100k+ entries compact
+
+        self.lookups = 0
+        self.hits = 0
+
+    def rebuild(self, challenges, user_ids):
+        # The hashing runs without the lock, users added meanwhile are filled in when swapping
+        user_ids = set(user_ids)
+        templates = {challenge_id: template for challenge_id, template in challenges if self.noise_tag in template}
+        owners = {
+            challenge_id: self._owners(template, user_ids)
+            for challenge_id, template in templates.items()
+        }
+
+        with self.lock:
+            added = self.user_ids - user_ids
+            self.templates = templates
+            self.patterns = {challenge_id: self._pattern(template) for challenge_id, template in templates.items()}
+            self.owners = owners
+            self.user_ids |= user_ids
+            self._add_users(added)
+
+    def add_user(self, user_id):
+        with self.lock:
+            if user_id not in self.user_ids:
+                self.user_ids.add(user_id)
+                self._add_users([user_id])
+
+    def set_challenge(self, challenge_id, template):
+        if self.noise_tag not in template:
+            self.remove_challenge(challenge_id)
+            return
+
+        with self.lock:
+            if self.templates.get(challenge_id) == template:
+                return
+            user_ids = set(self.user_ids)
+
+        owners = self._owners(template, user_ids)
+
+        with self.lock:
+            self.templates[challenge_id] = template
+            self.patterns[challenge_id] = self._pattern(template)
+            self.owners[challenge_id] = owners
+            for user_id in self.user_ids - user_ids:
+                owners[int(self.noise(user_id, template), 16)] = user_id
+
+    def remove_challenge(self, challenge_id):
+        with self.lock:
+            self.templates.pop(challenge_id, None)
+            self.patterns.pop(challenge_id, None)
+            self.owners.pop(challenge_id, None)
+
+    def is_indexed(self, challenge_id):
+        return challenge_id in self.templates
+
+    def lookup(self, challenge_id, submitted_flag):
+        submitted_flag = normalize_flag(submitted_flag)
+        if submitted_flag is None:
+            return None
+
+        # Both maps are swapped together by a rebuild or a removed challenge, so they are read together
+        with self.lock:
+            pattern = self.patterns.get(challenge_id)
+            owners = self.owners.get(challenge_id)
+        if pattern is None or owners is None:
+            return None
+
+        match = pattern.fullmatch(submitted_flag)
+        with self.lock:
+            owner = owners.get(int(match.group('noise'), 16)) if match is not None else None
+            self.lookups += 1
+            if owner is not None:
+                self.hits += 1
+        return owner
+
+    def stats(self):
+        with self.lock:
+            return {
+                'challenges': len(self.owners),
+                'entries': sum(len(owners) for owners in self.owners.values()),
+                'lookups': self.lookups,
+                'hits': self.hits,
+            }
+
+    def _owners(self, template, user_ids):
+        return {int(self.noise(user_id, template), 16): user_id for user_id in user_ids}
+
+    def _add_users(self, user_ids):
+        for challenge_id, template in self.templates.items():
+            owners = self.owners[challenge_id]
+            for user_id in user_ids:
+                owners[int(self.noise(user_id, template), 16)] = user_id
+
+    def _pattern(self, template):
+        # Every noise tag in a template gets the same noise
+        parts = [re.escape(part) for part in template.split(self.noise_tag)]
+        noise = f'(?P<noise>[0-9a-f]{{{self.noise_length}}})'
+        return re.compile(parts[0] + noise + '(?P=noise)'.join(parts[1:]))
@@ -0,0 +1,2 @@
+from .registry import MetricsRegistry, Counter, Histogram, DEFAULT_BUCKETS
+from .sampler import SlowRequestSampler
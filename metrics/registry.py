@@ -0,0 +1,125 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+
+        for labels, value in values:
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+        # Per label set: [count in each bucket (non-cumulative, last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                label_text = _format_labels(self.label_names, labels, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{label_text} {cumulative}'
+
+            label_text = _format_labels(self.label_names, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(total)}'
+            yield f'{self.name}_count{label_text} {cumulative}'
+
+
+class Collector:
+    def __init__(self, name, metric_type, help_text, label_names, collect):
+        self.name = name
+        self.type = metric_type
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def collector(self, name, metric_type, help_text, label_names, collect):
+        # Values read from existing stats when the metrics are rendered, collect yields (labels, value)
+        return self._register(Collector(name, metric_type, help_text, label_names, collect))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,86 @@
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+
+
+class SlowRequestSampler:
+    def __init__(self, threshold=1.0, interval=0.05, stack_limit=30, max_samples=200, max_reports=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+        self.max_samples = max_samples
+
+        # Thread id -> [endpoint, started_at, sampled stacks, sample count]
+        self.active = {}
+        self.lock = threading.Lock()
+        self.reports = deque(maxlen=max_reports)
+
+        self.stopped = threading.Event()
+        self.worker = None
+
+    def begin(self, endpoint):
+        with self.lock:
+            self.active[threading.get_ident()] = [endpoint, time.monotonic(), None, 0]
+
+    def end(self):
+        with self.lock:
+            entry = self.active.pop(threading.get_ident(), None)
+
+        if entry is None or entry[2] is None:
+            return
+
+        endpoint, started_at, stacks, samples = entry
+        duration = time.monotonic() - started_at
+        common = stacks.most_common(5)
+        self.reports.append({
+            'endpoint': endpoint,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'duration': round(duration, 3),
+            'samples': samples,
+            'stacks': [{'count': count, 'stack': stack} for stack, count in common],
+        })
+        logging.warning(f"Slow request {endpoint} took {duration:.2f}s, most sampled stack:\n{common[0][0]}")
+
+    def recent(self):
+        return list(self.reports)
+
+    def start(self):
+        if self.worker is not None:
+            return
+        self.stopped.clear()
+        self.worker = threading.Thread(target=self._run, name='slow-request-sampler', daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            with self.lock:
+                slow = [
+                    (ident, entry) for ident, entry in self.active.items()
+                    if now - entry[1] >= self.threshold and entry[3] < self.max_samples
+                ]
+            if not slow:
+                continue
+
+            frames = sys._current_frames()
+            for ident, entry in slow:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = ''.join(traceback.format_stack(frame, limit=self.stack_limit))
+
+                with self.lock:
+                    if entry[2] is None:
+                        entry[2] = Counter()
+                    entry[2][stack] += 1
+                    entry[3] += 1
@@ -1 +1,4 @@
-from .models import db, User, Challenge, Solve, Rating, Comment
+from .models import db, User, Challenge, Solve, Rating, Comment, AuditEvent, Setting
+from .database import init_database, get_database_uri
+from .migrations import upgrade_database, MigrationError
+from .upserts import upsert_solve, upsert_rating, upsert_comment
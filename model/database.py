@@ -0,0 +1,64 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from .models import db
+
+DEFAULT_DATABASE_URI = 'sqlite:///database.db'
+
+SQLITE_BUSY_TIMEOUT = 10_000  # ms
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', SQLITE_BUSY_TIMEOUT),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),  # Negative value is in KiB
+    ('temp_store', 'MEMORY'),
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+def get_database_uri():
+    return os.environ.get('EE_CTF_DATABASE_URI', DEFAULT_DATABASE_URI)
+
+
+def get_engine_options(database_uri, pool_size):
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': pool_size,
+        'pool_timeout': 30,
+    }
+
+    if database_uri.startswith('sqlite'):
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {
+            'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+            'check_same_thread': False,
+        }
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = 1800
+
+    return options
+
+
+def init_database(app, pool_size):
+    database_uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', get_database_uri())
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', get_engine_options(database_uri, pool_size))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+
+    db.init_app(app)
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
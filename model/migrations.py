@@ -0,0 +1,71 @@
+import logging
+
+from sqlalchemy import inspect, text
+
+from .models import db
+
+_DEDUPLICATE_STATEMENT = """
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, challenge_id ORDER BY {order}) AS position
+            FROM {table}
+        ) AS ranked
+        WHERE position > 1
+    )
+"""
+
+_DEDUPLICATE_ORDER = {
+    # Keep the earliest solve so first-blood ordering is preserved
+    'solve': 'solve_time, id',
+    # Keep the most recently written rating and comment
+    'rating': 'id DESC',
+    'comment': 'id DESC',
+}
+
+_DUPLICATE_CHALLENGES_QUERY = """
+    SELECT edition_number, number FROM challenge
+    GROUP BY edition_number, number
+    HAVING COUNT(*) > 1
+"""
+
+
+class MigrationError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+def missing_indexes(connection):
+    inspector = inspect(connection)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index.name for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def upgrade_database(engine):
+    db.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        # Cheap enough to run on every start, the table scans below only happen on an old schema
+        if not missing_indexes(connection):
+            logging.info("Database schema is up to date")
+            return
+
+        duplicates = connection.execute(text(_DUPLICATE_CHALLENGES_QUERY)).all()
+        if duplicates:
+            numbers = ', '.join(f"{edition}/{number}" for edition, number in duplicates)
+            raise MigrationError(f"Duplicate challenges must be resolved by hand: {numbers}")
+
+        for table_name, order in _DEDUPLICATE_ORDER.items():
+            statement = _DEDUPLICATE_STATEMENT.format(table=table_name, order=order)
+            removed = connection.execute(text(statement)).rowcount
+            if removed:
+                logging.info(f"Removed {removed} duplicate rows from {table_name}")
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+        logging.info("Database schema is up to date")
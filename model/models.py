@@ -26,8 +26,12 @@ class Challenge(db.Model):
     flag = db.Column(db.Text, nullable=False)
     icon = db.Column(db.String(50), nullable=False)
 
-    def is_available(self):
-        return datetime.now() >= self.start_date
+    __table_args__ = (
+        db.Index('ux_challenge_edition_number', 'edition_number', 'number', unique=True),
+    )
+
+    def is_available(self, now=None):
+        return (now or datetime.now()) >= self.start_date
 
 
 class Solve(db.Model):
@@ -36,6 +40,11 @@ class Solve(db.Model):
     challenge_id = db.Column(db.Integer, db.ForeignKey(Challenge.id), nullable=False)
     solve_time = db.Column(db.DateTime, nullable=False)
 
+    __table_args__ = (
+        db.Index('ux_solve_user_challenge', 'user_id', 'challenge_id', unique=True),
+        db.Index('ix_solve_challenge_time', 'challenge_id', 'solve_time'),
+    )
+
 
 class Rating(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,9 +52,39 @@ class Rating(db.Model):
     challenge_id = db.Column(db.Integer, db.ForeignKey(Challenge.id), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index('ux_rating_user_challenge', 'user_id', 'challenge_id', unique=True),
+    )
+
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String, db.ForeignKey(User.id), nullable=False)
     challenge_id = db.Column(db.Integer, db.ForeignKey(Challenge.id), nullable=False)
     comment = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('ux_comment_user_challenge', 'user_id', 'challenge_id', unique=True),
+        db.Index('ix_comment_challenge', 'challenge_id', 'id'),
+    )
+
+
+class Setting(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Text, nullable=False)
+
+
+class AuditEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.String)
+    challenge_id = db.Column(db.Integer)
+    payload = db.Column(db.Text)
+    correct = db.Column(db.Boolean)
+    ip_address = db.Column(db.String(45))
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_audit_event_user_challenge', 'user_id', 'challenge_id'),
+        db.Index('ix_audit_event_event_time', 'event', 'created_at'),
+    )
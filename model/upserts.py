@@ -0,0 +1,46 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import db, Solve, Rating, Comment
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _insert(model):
+    dialect = db.session.get_bind().dialect.name
+    return _INSERTS[dialect](model)
+
+
+def upsert_solve(user_id, challenge_id, solve_time):
+    statement = _insert(Solve).values(user_id=user_id, challenge_id=challenge_id, solve_time=solve_time)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Solve.user_id, Solve.challenge_id],
+        set_={'solve_time': statement.excluded.solve_time},
+        where=statement.excluded.solve_time < Solve.solve_time
+    )
+    result = db.session.execute(statement)
+    db.session.commit()
+
+    return result.rowcount > 0
+
+
+def upsert_rating(user_id, challenge_id, rating):
+    statement = _insert(Rating).values(user_id=user_id, challenge_id=challenge_id, rating=rating)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Rating.user_id, Rating.challenge_id],
+        set_={'rating': statement.excluded.rating}
+    )
+    db.session.execute(statement)
+    db.session.commit()
+
+
+def upsert_comment(user_id, challenge_id, comment):
+    statement = _insert(Comment).values(user_id=user_id, challenge_id=challenge_id, comment=comment)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Comment.user_id, Comment.challenge_id],
+        set_={'comment': statement.excluded.comment}
+    )
+    db.session.execute(statement)
+    db.session.commit()
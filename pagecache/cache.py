@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+class PageCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at is None or datetime.now() < expires_at:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                self._remove(key)
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, size=None, expires_at=None):
+        if size is None:
+            size = len(value)
+
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (value, size, expires_at)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                oldest_key = next(iter(self.entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        _value, size, _expires_at = self.entries.pop(key)
+        self.size -= size
@@ -0,0 +1,2 @@
+from .limiter import RateLimiter, RateLimitExceeded, TokenBucketStore
+from .sqlite_store import SQLiteBucketStore
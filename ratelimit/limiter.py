@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f'Rate limit exceeded, retry after {retry_after}s')
+
+
+class TokenBucketStore:
+    def __init__(self, max_buckets=100_000, idle_timeout=3600):
+        self.max_buckets = max_buckets
+        self.idle_timeout = idle_timeout
+
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def consume(self, buckets, cost=1):
+        # Every bucket is checked first and tokens are taken only if all of them allow the request,
+        # so a request rejected by one scope does not use up the quota of the others
+        now = time.monotonic()
+
+        with self.lock:
+            levels = []
+            for key, capacity, period in buckets:
+                refill_rate = capacity / period
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = [capacity, now]
+                    self.buckets[key] = bucket
+                else:
+                    bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+                    bucket[1] = now
+                    self.buckets.move_to_end(key)
+                levels.append((bucket, refill_rate))
+
+            self._evict(now)
+
+            retry_after = max(
+                (math.ceil((cost - bucket[0]) / refill_rate) for bucket, refill_rate in levels if bucket[0] < cost),
+                default=0
+            )
+            if not retry_after:
+                for bucket, _refill_rate in levels:
+                    bucket[0] -= cost
+
+            return retry_after
+
+    def _evict(self, now):
+        while self.buckets:
+            key, (tokens, last_seen) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_buckets and now - last_seen < self.idle_timeout:
+                break
+            del self.buckets[key]
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class RateLimiter:
+    def __init__(self, store, rules, user_id_getter, ip_getter):
+        self.store = store
+        self.rules = rules
+        self.user_id_getter = user_id_getter
+        self.ip_getter = ip_getter
+
+    def check(self, rule_name):
+        rule = dict(self.rules.get(rule_name, {}))
+        identities = {'user': self.user_id_getter(), 'ip': self.ip_getter()}
+
+        # Anonymous callers are limited by their address, the user limit applies if the rule has no IP limit
+        if identities['user'] is None and 'user' in rule:
+            rule.setdefault('ip', rule.pop('user'))
+
+        buckets = [
+            (f'{rule_name}:{scope}:{identities[scope]}', capacity, period)
+            for scope, (capacity, period) in rule.items()
+            if identities.get(scope) is not None
+        ]
+        if not buckets:
+            return
+
+        retry_after = self.store.consume(buckets)
+        if retry_after:
+            raise RateLimitExceeded(retry_after)
+
+    def limit(self, rule_name):
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                self.check(rule_name)
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
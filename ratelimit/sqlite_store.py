@@ -0,0 +1,69 @@
+import math
+import threading
+import time
+
+from shared import SQLiteConnections
+
+
+class SQLiteBucketStore:
+    def __init__(self, path, idle_timeout=3600, cleanup_every=1000):
+        self.connections = SQLiteConnections(path)
+        self.idle_timeout = idle_timeout
+        self.cleanup_every = cleanup_every
+
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.evictions = 0
+
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, last_seen REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_last_seen ON rate_limit_buckets (last_seen)'
+            )
+
+    def consume(self, buckets, cost=1):
+        # Tokens are taken only if every bucket allows the request, see TokenBucketStore.consume
+        now = time.time()
+
+        with self.connections.transaction() as connection:
+            levels = []
+            for key, capacity, period in buckets:
+                refill_rate = capacity / period
+                row = connection.execute(
+                    'SELECT tokens, last_seen FROM rate_limit_buckets WHERE key = ?', (key,)
+                ).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill_rate)
+                levels.append((key, tokens, refill_rate))
+
+            retry_after = max(
+                (math.ceil((cost - tokens) / refill_rate) for _key, tokens, refill_rate in levels if tokens < cost),
+                default=0
+            )
+
+            connection.executemany(
+                'INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, last_seen) VALUES (?, ?, ?)',
+                [(key, tokens if retry_after else tokens - cost, now) for key, tokens, _refill_rate in levels]
+            )
+
+        with self.lock:
+            self.calls += 1
+            cleanup = self.calls % self.cleanup_every == 0
+        if cleanup:
+            self.cleanup()
+
+        return retry_after
+
+    def cleanup(self):
+        with self.connections.transaction() as connection:
+            evicted = connection.execute(
+                'DELETE FROM rate_limit_buckets WHERE last_seen < ?', (time.time() - self.idle_timeout,)
+            ).rowcount
+
+        with self.lock:
+            self.evictions += evicted
+
+    def __len__(self):
+        return self.connections.execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+STATE_SCHEDULED = 'scheduled'
+STATE_WARMING = 'warming'
+STATE_WARM = 'warm'
+STATE_FAILED = 'failed'
+STATE_RELEASED = 'released'  # Already out when the timeline was loaded, nothing to warm
+
+
+class Release:
+    def __init__(self, challenge_id, number, start_date):
+        self.challenge_id = challenge_id
+        self.number = number
+        self.start_date = start_date
+
+        self.state = STATE_SCHEDULED
+        self.warmed_at = None
+        self.duration = None
+        self.details = None
+        self.error = None
+
+    def as_dict(self):
+        return {
+            'challenge_id': self.challenge_id,
+            'number': self.number,
+            'start_date': self.start_date,
+            'state': self.state,
+            'warmed_at': self.warmed_at,
+            'duration': self.duration,
+            'details': self.details,
+            'error': self.error,
+        }
+
+
+class ReleaseScheduler:
+    def __init__(self, app, timeline_loader, warm, lead_time=60, refresh_interval=300, released_history=5):
+        self.app = app
+        self.timeline_loader = timeline_loader  # -> [(challenge_id, number, start_date)], in the app context
+        self.warm = warm  # (challenge_id, start_date) -> details, in the app context
+        self.lead_time = timedelta(seconds=lead_time)
+        self.refresh_interval = refresh_interval
+        self.released_history = released_history
+
+        self.lock = threading.Lock()
+        self.releases = []
+        self.stale = True
+        self.loaded_at = None
+
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.worker = None
+
+    def reload(self):
+        # Challenges or the edition changed, cached pages are gone so upcoming releases are warmed again
+        self.stale = True
+        self.wakeup.set()
+
+    def next_release(self, now=None):
+        now = now or datetime.now()
+        with self.lock:
+            for release in self.releases:
+                if release.start_date > now:
+                    return release.start_date
+        return None
+
+    def overview(self, now=None):
+        now = now or datetime.now()
+        with self.lock:
+            released = [release for release in self.releases if release.start_date <= now]
+            upcoming = [release for release in self.releases if release.start_date > now]
+            return {
+                'running': self.worker is not None,
+                'loaded_at': self.loaded_at,
+                'lead_time': self.lead_time.total_seconds(),
+                'recent': [release.as_dict() for release in released[-self.released_history:]],
+                'upcoming': [release.as_dict() for release in upcoming],
+            }
+
+    def start(self):
+        if self.worker is not None:
+            return
+        self.stopped.clear()
+        self.worker = threading.Thread(target=self._run, name='release-scheduler', daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
+
+    def _run(self):
+        next_load = 0
+        while not self.stopped.is_set():
+            if self.stale or time.monotonic() >= next_load:
+                self._load(reset=self.stale)
+                next_load = time.monotonic() + self.refresh_interval
+
+            now = datetime.now()
+            for release in self._due(now):
+                self._warm(release)
+
+            # Sleep until the next warm-up window opens, a reload or the periodic refresh
+            timeout = next_load - time.monotonic()
+            next_window = self._next_window(now)
+            if next_window is not None:
+                timeout = min(timeout, (next_window - datetime.now()).total_seconds())
+            self.wakeup.wait(max(timeout, 0))
+            self.wakeup.clear()
+
+    def _load(self, reset):
+        self.stale = False
+        try:
+            with self.app.app_context():
+                timeline = self.timeline_loader()
+        except Exception:
+            logging.exception("Could not load the release timeline")
+            return
+
+        now = datetime.now()
+        releases = []
+        for challenge_id, number, start_date in sorted(timeline, key=lambda row: (row[2], row[1])):
+            release = Release(challenge_id, number, start_date)
+            if start_date <= now:
+                release.state = STATE_RELEASED
+            releases.append(release)
+
+        with self.lock:
+            # Past releases keep their warm-up results for the admin view, upcoming ones only without a reset
+            previous = {(release.challenge_id, release.start_date): release for release in self.releases}
+            for index, release in enumerate(releases):
+                known = previous.get((release.challenge_id, release.start_date))
+                if known is not None and (not reset or release.start_date <= now):
+                    releases[index] = known
+            self.releases = releases
+            self.loaded_at = now
+
+    def _due(self, now):
+        with self.lock:
+            return [
+                release for release in self.releases
+                if release.state == STATE_SCHEDULED and release.start_date - self.lead_time <= now < release.start_date
+            ]
+
+    def _next_window(self, now):
+        with self.lock:
+            windows = [
+                release.start_date - self.lead_time for release in self.releases
+                if release.state == STATE_SCHEDULED and release.start_date > now
+            ]
+        return min(windows, default=None)
+
+    def _warm(self, release):
+        release.state = STATE_WARMING
+        started_at = time.perf_counter()
+        try:
+            with self.app.app_context():
+                release.details = self.warm(release.challenge_id, release.start_date)
+        except Exception as e:
+            release.state = STATE_FAILED
+            release.error = str(e)
+            logging.warning(f"Warming up challenge {release.challenge_id} for its release failed: {e}")
+        else:
+            release.state = STATE_WARM
+            release.error = None
+            logging.info(f"Challenge {release.challenge_id} warmed up for its release at {release.start_date}")
+        release.duration = time.perf_counter() - started_at
+        release.warmed_at = datetime.now()
@@ -1,12 +1,128 @@
+import logging
+import os
+import secrets
+import signal
+import socket
+import sys
+
 from waitress import serve
-from app import app
-
-serve(
-    app,
-    host='localhost',
-    port=8080,
-    threads=8,
-    backlog=2048,
-    channel_timeout=120,
-    connection_limit=2000,
-)
+
+HOST = os.environ.get('EE_CTF_HOST', 'localhost')
+PORT = int(os.environ.get('EE_CTF_PORT', 8080))
+WORKERS = int(os.environ.get('EE_CTF_WORKERS', 1))
+BACKLOG = 2048
+TRUSTED_PROXY = os.environ.get('EE_CTF_TRUSTED_PROXY')  # Address of a reverse proxy setting X-Forwarded-For
+# The file a single process and the CLI use too, so CLI commands reach every worker
+DEFAULT_SHARED_STATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'shared_state.db')
+
+SERVE_OPTIONS = {
+    'backlog': BACKLOG,
+    'channel_timeout': 120,
+    'connection_limit': 2000,
+}
+
+if TRUSTED_PROXY:
+    SERVE_OPTIONS.update({
+        'trusted_proxy': TRUSTED_PROXY,
+        'trusted_proxy_count': 1,
+        'trusted_proxy_headers': 'x-forwarded-for x-forwarded-proto',
+    })
+
+
+def serve_app(sockets=None):
+    # Imported here so every worker creates its own app after the fork
+    from app import create_app, start_background_tasks, SERVER_THREADS
+
+    app = create_app()
+    start_background_tasks(app)
+    if sockets is None:
+        serve(app, host=HOST, port=PORT, threads=SERVER_THREADS, **SERVE_OPTIONS)
+    else:
+        serve(app, sockets=sockets, threads=SERVER_THREADS, **SERVE_OPTIONS)
+
+
+def run_forked(target, *args):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        status = 0
+        try:
+            target(*args)
+        except BaseException:
+            logging.exception("Worker failed")
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def prepare_app():
+    # The schema is created once up front, so the workers don't race on it
+    from app import create_app, create_schema
+    from model import MigrationError
+
+    try:
+        create_schema(create_app())
+    except MigrationError as e:
+        sys.exit(f"{e.message}, then run flask upgrade-db")
+
+
+def spawn_worker(listen_socket):
+    return run_forked(serve_app, [listen_socket])
+
+
+def prefork(workers):
+    # Workers must agree on the secret key and share sessions and process-local state through SQLite
+    os.environ.setdefault('EE_CTF_SECRET_KEY', secrets.token_hex(32))
+    os.environ.setdefault('EE_CTF_SHARED_STATE', DEFAULT_SHARED_STATE)
+    os.makedirs(os.path.dirname(os.environ['EE_CTF_SHARED_STATE']) or '.', exist_ok=True)
+
+    _, status = os.waitpid(run_forked(prepare_app), 0)
+    if status != 0:
+        sys.exit("Could not initialize the app")
+
+    listen_socket = socket.create_server((HOST, PORT), backlog=BACKLOG)
+    children = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children.add(spawn_worker(listen_socket))
+    logging.info(f"Serving on http://{HOST}:{PORT} with {workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        children.discard(pid)
+        if not stopping:
+            logging.warning(f"Worker {pid} exited with status {status}, restarting")
+            children.add(spawn_worker(listen_socket))
+
+    listen_socket.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    if WORKERS > 1 and hasattr(os, 'fork'):
+        prefork(WORKERS)
+    else:
+        if WORKERS > 1:
+            logging.warning("Multiple workers need os.fork, serving with a single process")
+        prepare_app()
+        serve_app()
+        sys.exit(0)
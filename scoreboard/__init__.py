@@ -0,0 +1,2 @@
+from .scoreboard import Scoreboard
+from .statistics import ChallengeStatistics, RATING_VALUES
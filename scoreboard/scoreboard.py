@@ -0,0 +1,146 @@
+import bisect
+import threading
+
+
+def make_nick(first_name, last_name):
+    if not last_name:
+        return first_name
+    return f"{first_name} {last_name[0]}."
+
+
+class Scoreboard:
+    def __init__(self, top_size=5):
+        self.top_size = top_size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.challenges = {}
+            self.nicks = {}
+            self.solves = {}
+            self.top = {}
+            self.edition_scores = {}
+            self.rankings = {}
+            self.last_solve_id = 0
+
+    def rebuild(self, challenges, users, solves):
+        self.reset()
+
+        for challenge_id, edition_number in challenges:
+            self.add_challenge(challenge_id, edition_number)
+
+        for user_id, first_name, last_name in users:
+            self.add_user(user_id, first_name, last_name)
+
+        for solve_id, user_id, challenge_id, solve_time in solves:
+            self.record_solve(user_id, challenge_id, solve_time, solve_id)
+
+    def add_challenge(self, challenge_id, edition_number):
+        with self.lock:
+            self.challenges[challenge_id] = edition_number
+            self.top.setdefault(challenge_id, [])
+
+    def remove_edition(self, edition_number):
+        # Players keep their nicks, they may still play other editions
+        with self.lock:
+            challenge_ids = {ch_id for ch_id, edition in self.challenges.items() if edition == edition_number}
+            for challenge_id in challenge_ids:
+                del self.challenges[challenge_id]
+                self.top.pop(challenge_id, None)
+
+            for user_id in list(self.solves):
+                user_solves = self.solves[user_id]
+                for challenge_id in challenge_ids & user_solves.keys():
+                    del user_solves[challenge_id]
+                if not user_solves:
+                    del self.solves[user_id]
+
+            self.edition_scores.pop(edition_number, None)
+            self.rankings.pop(edition_number, None)
+
+    def add_user(self, user_id, first_name, last_name):
+        with self.lock:
+            self.nicks[user_id] = make_nick(first_name, last_name)
+            for edition_number in self.edition_scores:
+                if user_id in self.edition_scores[edition_number]:
+                    self.rankings.pop(edition_number, None)
+
+    def has_user(self, user_id):
+        return user_id in self.nicks
+
+    def record_solve(self, user_id, challenge_id, solve_time, solve_id=None):
+        with self.lock:
+            if solve_id is not None:
+                self.last_solve_id = max(self.last_solve_id, solve_id)
+
+            user_solves = self.solves.setdefault(user_id, {})
+            previous_time = user_solves.get(challenge_id)
+            if previous_time is not None and previous_time <= solve_time:
+                return False
+
+            user_solves[challenge_id] = solve_time
+            self._update_top(user_id, challenge_id, solve_time, previous_time)
+
+            edition_number = self.challenges.get(challenge_id)
+            if edition_number is not None:
+                scores = self.edition_scores.setdefault(edition_number, {})
+                solved_count, last_solve = scores.get(user_id, (0, None))
+                if previous_time is None:
+                    solved_count += 1
+                last_solve = max(
+                    time for ch_id, time in user_solves.items() if self.challenges.get(ch_id) == edition_number
+                )
+                scores[user_id] = (solved_count, last_solve)
+                self.rankings.pop(edition_number, None)
+
+            return True
+
+    def _update_top(self, user_id, challenge_id, solve_time, previous_time):
+        top = self.top.setdefault(challenge_id, [])
+
+        if previous_time is not None:
+            try:
+                top.remove((previous_time, user_id))
+            except ValueError:
+                pass
+
+        if len(top) < self.top_size or solve_time < top[-1][0]:
+            bisect.insort(top, (solve_time, user_id))
+            del top[self.top_size:]
+
+    def is_solved(self, user_id, challenge_id):
+        return challenge_id in self.solves.get(user_id, ())
+
+    def solved_challenges(self, user_id):
+        with self.lock:
+            return set(self.solves.get(user_id, ()))
+
+    def top_solvers(self, challenge_id):
+        with self.lock:
+            return [
+                (user_id, self.nicks.get(user_id, user_id), solve_time)
+                for solve_time, user_id in self.top.get(challenge_id, ())
+            ]
+
+    def ranking(self, edition_number):
+        ranking = self.rankings.get(edition_number)
+        if ranking is not None:
+            return ranking
+
+        with self.lock:
+            scores = self.edition_scores.get(edition_number, {})
+            ordered = sorted(scores.items(), key=lambda item: (-item[1][0], item[1][1]))
+
+            ranking = []
+            for position, (user_id, (solved_count, last_solve)) in enumerate(ordered, start=1):
+                ranking.append({
+                    'rank': position,
+                    'nick': self.nicks.get(user_id, user_id),
+                    'solves': solved_count,
+                    'last_solve': last_solve.isoformat()
+                })
+
+            self.rankings[edition_number] = ranking
+
+        return ranking
@@ -0,0 +1,165 @@
+import bisect
+import threading
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+
+class ChallengeStatistics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.challenges = {}
+            self.ratings = {}
+            self.commented = set()
+            self.players = {}
+
+    def rebuild(self, challenges, solves, ratings, comments):
+        self.reset()
+
+        for challenge_id, edition_number, start_date in challenges:
+            self.add_challenge(challenge_id, edition_number, start_date)
+
+        for user_id, challenge_id, solve_time in solves:
+            self.record_solve(user_id, challenge_id, solve_time)
+
+        for user_id, challenge_id, rating in ratings:
+            self.record_rating(user_id, challenge_id, rating)
+
+        for user_id, challenge_id in comments:
+            self.record_comment(user_id, challenge_id)
+
+    def add_challenge(self, challenge_id, edition_number, start_date):
+        with self.lock:
+            previous = self.challenges.get(challenge_id)
+            entry = previous or {
+                'solves': {},
+                'durations': [],
+                'ratings': [0] * len(RATING_VALUES),
+                'comments': 0,
+            }
+            entry['edition_number'] = edition_number
+            entry['start_date'] = start_date
+
+            if previous is not None and previous['start_date'] != start_date:
+                entry['durations'] = sorted(
+                    (solve_time - start_date).total_seconds() for solve_time in entry['solves'].values()
+                )
+
+            self.challenges[challenge_id] = entry
+
+    def remove_edition(self, edition_number):
+        with self.lock:
+            challenge_ids = {
+                challenge_id for challenge_id, entry in self.challenges.items()
+                if entry['edition_number'] == edition_number
+            }
+            for challenge_id in challenge_ids:
+                del self.challenges[challenge_id]
+
+            self.ratings = {key: rating for key, rating in self.ratings.items() if key[1] not in challenge_ids}
+            self.commented = {key for key in self.commented if key[1] not in challenge_ids}
+            self.players.pop(edition_number, None)
+
+    def record_solve(self, user_id, challenge_id, solve_time):
+        with self.lock:
+            entry = self.challenges.get(challenge_id)
+            if entry is None:
+                return
+
+            previous_time = entry['solves'].get(user_id)
+            if previous_time is not None and previous_time <= solve_time:
+                return
+
+            if previous_time is not None:
+                self._remove_duration(entry, (previous_time - entry['start_date']).total_seconds())
+            entry['solves'][user_id] = solve_time
+            bisect.insort(entry['durations'], (solve_time - entry['start_date']).total_seconds())
+
+            self.players.setdefault(entry['edition_number'], set()).add(user_id)
+
+    def record_rating(self, user_id, challenge_id, rating):
+        if rating not in RATING_VALUES:
+            return
+
+        with self.lock:
+            entry = self.challenges.get(challenge_id)
+            if entry is None:
+                return
+
+            previous = self.ratings.get((user_id, challenge_id))
+            if previous == rating:
+                return
+
+            if previous is not None:
+                entry['ratings'][previous - 1] -= 1
+            entry['ratings'][rating - 1] += 1
+            self.ratings[(user_id, challenge_id)] = rating
+
+    def record_comment(self, user_id, challenge_id):
+        with self.lock:
+            entry = self.challenges.get(challenge_id)
+            if entry is None or (user_id, challenge_id) in self.commented:
+                return
+
+            self.commented.add((user_id, challenge_id))
+            entry['comments'] += 1
+
+    def user_rating(self, user_id, challenge_id):
+        return self.ratings.get((user_id, challenge_id), 0)
+
+    def summary(self, challenge_id):
+        with self.lock:
+            entry = self.challenges.get(challenge_id)
+            if entry is None:
+                return None
+
+            distribution = list(entry['ratings'])
+            rating_count = sum(distribution)
+            solves = len(entry['solves'])
+            players = len(self.players.get(entry['edition_number'], ()))
+
+            return {
+                'rating_count': rating_count,
+                'rating_average': (
+                    sum(value * count for value, count in zip(RATING_VALUES, distribution)) / rating_count
+                    if rating_count else None
+                ),
+                'rating_distribution': distribution,
+                'solves': solves,
+                'solve_rate': solves / players if players else None,
+                'median_solve_seconds': self._median(entry['durations']),
+                'comments': entry['comments'],
+            }
+
+    def edition_summaries(self, edition_number):
+        with self.lock:
+            challenge_ids = [
+                challenge_id for challenge_id, entry in self.challenges.items()
+                if entry['edition_number'] == edition_number
+            ]
+
+        return {challenge_id: self.summary(challenge_id) for challenge_id in challenge_ids}
+
+    def editions(self):
+        with self.lock:
+            return sorted({entry['edition_number'] for entry in self.challenges.values()})
+
+    @staticmethod
+    def _remove_duration(entry, duration):
+        durations = entry['durations']
+        index = bisect.bisect_left(durations, duration)
+        if index < len(durations) and durations[index] == duration:
+            del durations[index]
+
+    @staticmethod
+    def _median(values):
+        if not values:
+            return None
+
+        middle = len(values) // 2
+        if len(values) % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
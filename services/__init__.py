@@ -0,0 +1,2 @@
+from .registry import ServiceRegistry
+from .tasks import BackgroundTasks
@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self.factories = {}
+        self.services = {}
+        self.loading = set()
+        self.condition = threading.Condition()
+        self.load_times = {}
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    def get(self, name):
+        if name in self.services:
+            return self.services[name]
+
+        # Every service is built once, concurrent users wait for the first one
+        with self.condition:
+            while True:
+                if name in self.services:
+                    return self.services[name]
+
+                if name not in self.loading:
+                    self.loading.add(name)
+                    break
+
+                self.condition.wait()
+
+        loaded = False
+        try:
+            started_at = time.perf_counter()
+            service = self.factories[name]()
+            loaded = True
+        finally:
+            with self.condition:
+                self.loading.discard(name)
+                if loaded:
+                    self.services[name] = service
+                    self.load_times[name] = time.perf_counter() - started_at
+                self.condition.notify_all()
+
+        return service
+
+    def loaded(self, name):
+        return name in self.services
+
+    def stats(self):
+        with self.condition:
+            return {
+                'registered': len(self.factories),
+                'loaded': len(self.services),
+                'load_times': dict(self.load_times),
+            }
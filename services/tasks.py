@@ -0,0 +1,42 @@
+import logging
+import threading
+
+
+class BackgroundTasks:
+    def __init__(self, app):
+        self.app = app
+        self.tasks = []
+        self.running = []
+        self.lock = threading.Lock()
+
+    def add(self, name, start, stop=None):
+        # Both run inside the app context
+        self.tasks.append((name, start, stop))
+
+    def add_thread(self, name, target):
+        # One-off work like warming caches, in its own thread so it never delays serving
+        def start():
+            threading.Thread(target=self._run, args=(target,), name=name, daemon=True).start()
+
+        self.add(name, start)
+
+    def start(self):
+        with self.lock, self.app.app_context():
+            if self.running:
+                return
+
+            for name, start, stop in self.tasks:
+                start()
+                self.running.append((name, stop))
+                logging.info(f"Started background task {name}")
+
+    def stop(self):
+        with self.lock, self.app.app_context():
+            while self.running:
+                name, stop = self.running.pop()
+                if stop is not None:
+                    stop()
+
+    def _run(self, target):
+        with self.app.app_context():
+            target()
@@ -0,0 +1,3 @@
+from .interface import ServerSession, ServerSessionInterface
+from .store import MemorySessionStore, SQLiteSessionStore
+from .users import UserCache
@@ -0,0 +1,90 @@
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from werkzeug.datastructures import CallbackDict
+
+SID_BYTES = 32
+AUTHENTICATED_KEY = 'user_id'
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.regenerated = False
+
+    def regenerate(self):
+        # A new id after login, so an id planted before authentication is worthless afterwards
+        self.regenerated = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, authenticated_key=AUTHENTICATED_KEY):
+        self.store = store
+        self.authenticated_key = authenticated_key
+        # Anonymous visitors only carry a language and flash messages, those stay in a signed cookie.
+        # Stored sessions are created on login only, so anonymous traffic can never push them out
+        self.cookies = SecureCookieSessionInterface()
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return ServerSession()
+
+        # Session ids are plain url-safe tokens, signed cookies always contain a dot
+        if '.' not in value:
+            data = self.store.load(value)
+            return ServerSession(data, value) if data is not None else ServerSession()
+
+        serializer = self.cookies.get_signing_serializer(app)
+        try:
+            data = serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return ServerSession()
+        return ServerSession(data)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        authenticated = self.authenticated_key in session
+
+        # Logged out, the stored session goes away whatever is left in it
+        if session.sid is not None and (not authenticated or session.regenerated):
+            self.store.delete(session.sid)
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            response.vary.add('Cookie')
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        if authenticated:
+            value = session.sid
+            if value is None or session.regenerated:
+                value = secrets.token_urlsafe(SID_BYTES)
+            self.store.save(value, dict(session))
+        else:
+            value = self.cookies.get_signing_serializer(app).dumps(dict(session))
+
+        response.set_cookie(
+            name,
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
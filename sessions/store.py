@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from shared import SQLiteConnections
+
+DEFAULT_TTL = 14 * 24 * 3600
+DEFAULT_MAX_SIZE = 100_000
+
+
+class MemorySessionStore:
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # Loading a session extends it by the full ttl, so access order is also expiry order.
+        # Data is kept serialized, like in the SQLite store, so requests never share mutable values
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def load(self, sid):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            entry = self.sessions.get(sid)
+            if entry is None:
+                return None
+            self.sessions[sid] = (now + self.ttl, entry[1])
+            self.sessions.move_to_end(sid)
+
+        return json.loads(entry[1])
+
+    def save(self, sid, data):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            self.sessions[sid] = (now + self.ttl, json.dumps(data))
+            self.sessions.move_to_end(sid)
+            while len(self.sessions) > self.max_size:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, sid):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+    def _expire(self, now):
+        while self.sessions:
+            expires_at, _data = next(iter(self.sessions.values()))
+            if expires_at > now:
+                break
+            self.sessions.popitem(last=False)
+            self.expirations += 1
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.sessions), 'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class SQLiteSessionStore:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, cleanup_every=1000):
+        self.connections = SQLiteConnections(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.cleanup_every = cleanup_every
+
+        self.saves = 0
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+
+    def load(self, sid):
+        now = time.time()
+        row = self.connections.execute('SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+
+        data, expires_at = row
+        # Only extend the expiry once half of the ttl is used up, so most requests stay read-only
+        if expires_at - now < self.ttl / 2:
+            with self.connections.transaction() as connection:
+                connection.execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (now + self.ttl, sid))
+
+        return json.loads(data)
+
+    def save(self, sid, data):
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                (sid, json.dumps(data), time.time() + self.ttl)
+            )
+
+        with self.lock:
+            self.saves += 1
+            cleanup = self.saves % self.cleanup_every == 0
+
+        if cleanup:
+            self.cleanup()
+
+    def delete(self, sid):
+        with self.connections.transaction() as connection:
+            connection.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def cleanup(self):
+        with self.connections.transaction() as connection:
+            expired = connection.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+            evicted = connection.execute(
+                'DELETE FROM sessions WHERE sid IN ('
+                'SELECT sid FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            ).rowcount
+
+        with self.lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def stats(self):
+        size = self.connections.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        return {'size': size, 'evictions': self.evictions, 'expirations': self.expirations}
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    def __init__(self, loader, max_size=10_000, ttl=300):
+        self.loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None and now < entry[0]:
+                self.users.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Unknown users are not cached, they only show up with stale sessions
+        user = self.loader(user_id)
+        if user is None:
+            return None
+
+        with self.lock:
+            self.users[user_id] = (now + self.ttl, user)
+            self.users.move_to_end(user_id)
+            if len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+        return user
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.users), 'hits': self.hits, 'misses': self.misses}
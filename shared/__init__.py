@@ -0,0 +1,3 @@
+from .sqlite import SQLiteConnections
+from .state import LocalSharedState, SQLiteSharedState
+from .watch import ChangeWatcher
@@ -0,0 +1,33 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteConnections:
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def execute(self, statement, parameters=()):
+        return self.connection().execute(statement, parameters)
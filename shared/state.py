@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+
+from .sqlite import SQLiteConnections
+
+EVENT_RETENTION = 3600  # Seconds, workers read new events at least once per poll interval
+
+
+class LocalSharedState:
+    def bump(self, name):
+        pass
+
+    def changes(self):
+        return set()
+
+    def publish(self, name, payload):
+        pass
+
+    def events(self, name):
+        return []
+
+
+class SQLiteSharedState:
+    def __init__(self, path, poll_interval=1.0, cleanup_every=1000):
+        self.connections = SQLiteConnections(path)
+        self.poll_interval = poll_interval
+        self.cleanup_every = cleanup_every
+
+        self.lock = threading.Lock()
+        self.next_poll = 0
+        self.published = 0
+
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, payload TEXT NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_events_name_id ON events (name, id)')
+        self.seen = self._read()
+
+        # State loaded from the database after this point already includes older events
+        last_event_id = self.connections.execute('SELECT MAX(id) FROM events').fetchone()[0] or 0
+        self.event_positions = {}
+        self.default_event_position = last_event_id
+
+    def _read(self):
+        return dict(self.connections.execute('SELECT name, value FROM generations').fetchall())
+
+    def _bump(self, connection, name):
+        row = connection.execute('SELECT value FROM generations WHERE name = ?', (name,)).fetchone()
+        current = row[0] if row is not None else 0
+        connection.execute(
+            'INSERT INTO generations (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+            (name, current + 1)
+        )
+        return current
+
+    def bump(self, name):
+        with self.connections.transaction() as connection:
+            current = self._bump(connection, name)
+
+        with self.lock:
+            # Skip our own change unless another process changed it in the meantime
+            if self.seen.get(name, 0) == current:
+                self.seen[name] = current + 1
+
+    def changes(self):
+        now = time.monotonic()
+        with self.lock:
+            if now < self.next_poll:
+                return set()
+            self.next_poll = now + self.poll_interval
+
+        generations = self._read()
+
+        with self.lock:
+            changed = {name for name, value in generations.items() if self.seen.get(name) != value}
+            self.seen.update(generations)
+
+        return changed
+
+    def publish(self, name, payload):
+        # The publishing worker reads its own events back too, so they are applied in order everywhere
+        # and must be safe to apply twice
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'INSERT INTO events (name, payload, created_at) VALUES (?, ?, ?)',
+                (name, json.dumps(payload), time.time())
+            )
+            self._bump(connection, name)
+
+            with self.lock:
+                self.published += 1
+                cleanup = self.published % self.cleanup_every == 0
+            if cleanup:
+                connection.execute('DELETE FROM events WHERE created_at < ?', (time.time() - EVENT_RETENTION,))
+
+    def events(self, name):
+        with self.lock:
+            position = self.event_positions.get(name, self.default_event_position)
+
+        rows = self.connections.execute(
+            'SELECT id, payload FROM events WHERE name = ? AND id > ? ORDER BY id', (name, position)
+        ).fetchall()
+        if not rows:
+            return []
+
+        with self.lock:
+            self.event_positions[name] = max(self.event_positions.get(name, position), rows[-1][0])
+        return [json.loads(payload) for _id, payload in rows]
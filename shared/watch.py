@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class ChangeWatcher:
+    # Notices changes nobody announced, like rows edited by hand, by comparing a fingerprint now and then
+    def __init__(self, fingerprint, interval=30):
+        self.fingerprint = fingerprint
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.value = fingerprint()
+        self.next_check = time.monotonic() + interval
+
+    def changed(self):
+        # Only one thread compares, the others carry on meanwhile
+        now = time.monotonic()
+        if now < self.next_check:
+            return False
+        with self.lock:
+            if now < self.next_check:
+                return False
+            self.next_check = now + self.interval
+
+        value = self.fingerprint()
+        with self.lock:
+            changed = value != self.value
+            self.value = value
+        return changed
+
+    def reset(self):
+        value = self.fingerprint()
+        with self.lock:
+            self.value = value
+            self.next_check = time.monotonic() + self.interval
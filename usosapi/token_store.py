@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+from shared import SQLiteConnections
+
+DEFAULT_TTL = 1800
+DEFAULT_MAX_SIZE = 10_000
+
+
+class MemoryTokenStore:
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # Every token lives for the same ttl, so insertion order is also expiry order
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def put(self, token, secret):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            self.tokens[token] = (now + self.ttl, secret)
+            self.tokens.move_to_end(token)
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, token):
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            entry = self.tokens.pop(token, None)
+
+        return entry[1] if entry is not None else None
+
+    def _expire(self, now):
+        while self.tokens:
+            expires_at, _secret = next(iter(self.tokens.values()))
+            if expires_at > now:
+                break
+            self.tokens.popitem(last=False)
+            self.expirations += 1
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.tokens), 'evictions': self.evictions, 'expirations': self.expirations}
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+class SQLiteTokenStore:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, cleanup_every=100):
+        self.connections = SQLiteConnections(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.cleanup_every = cleanup_every
+
+        self.puts = 0
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pending_tokens ('
+                'token TEXT PRIMARY KEY, secret TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_pending_tokens_expires_at ON pending_tokens (expires_at)')
+
+    def put(self, token, secret):
+        now = time.time()
+        with self.connections.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO pending_tokens (token, secret, expires_at) VALUES (?, ?, ?)',
+                (token, secret, now + self.ttl)
+            )
+
+        with self.lock:
+            self.puts += 1
+            cleanup = self.puts % self.cleanup_every == 0
+
+        if cleanup:
+            self.cleanup()
+
+    def pop(self, token):
+        with self.connections.transaction() as connection:
+            row = connection.execute(
+                'SELECT secret, expires_at FROM pending_tokens WHERE token = ?', (token,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            connection.execute('DELETE FROM pending_tokens WHERE token = ?', (token,))
+
+        secret, expires_at = row
+        return secret if expires_at > time.time() else None
+
+    def cleanup(self):
+        with self.connections.transaction() as connection:
+            expired = connection.execute('DELETE FROM pending_tokens WHERE expires_at <= ?', (time.time(),)).rowcount
+            evicted = connection.execute(
+                'DELETE FROM pending_tokens WHERE token IN ('
+                'SELECT token FROM pending_tokens ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            ).rowcount
+
+        with self.lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def stats(self):
+        size = self.connections.execute('SELECT COUNT(*) FROM pending_tokens').fetchone()[0]
+        return {'size': size, 'evictions': self.evictions, 'expirations': self.expirations}
+
+    def __len__(self):
+        return self.stats()['size']
+
@@ -1,7 +1,11 @@
-import logging
 import time
+
 import rauth
-import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .token_store import MemoryTokenStore
 
 _REQUEST_TOKEN_SUFFIX = 'services/oauth/request_token'
 _AUTHORIZE_SUFFIX = 'services/oauth/authorize'
@@ -20,14 +24,66 @@ class USOSAPIAuthorizationError(Exception):
         super().__init__(self.message)
 
 
+class USOSAPIConnectionError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class USOSAPIAuthorizedSession:
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+
+    @property
+    def access_token(self):
+        return self.session.access_token
+
+    def get_access_data(self):
+        return self.session.access_token, self.session.access_token_secret
+
+    def fetch_from_service(self, service, **kwargs):
+        if self.session is None:
+            raise USOSAPISessionNotAuthorizedError('Trying to fetch data from not authorized USOSAPI session')
+
+        return self.client.post(self.session, service, kwargs)
+
+    def is_session_authorized(self):
+        if self.session is None:
+            return False
+
+        try:
+            identity = self.fetch_from_service('services/users/user')
+            return bool(identity['id'])
+        except (USOSAPISessionNotAuthorizedError, USOSAPIConnectionError):
+            return False
+
+    def close_session(self):
+        if self.session is None:
+            return
+
+        self.fetch_from_service('services/oauth/revoke_token')
+        self.session = None
+
+
 class USOSAPISession:
-    def __init__(self, api_base_address, consumer_key, consumer_secret, scopes):
+    def __init__(self, api_base_address, consumer_key, consumer_secret, scopes, timeout=(3, 10), retries=2,
+                 pool_size=16, token_store=None, observer=None):
         self.scopes = scopes
+        self.timeout = timeout
+        self.observer = observer
 
         base_address = api_base_address
         if not base_address.endswith('/'):
             base_address += '/'
 
+        # Shared by every per-login session, so connections to USOS are reused
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.3)
+        )
+
         self.service = rauth.OAuth1Service(
             consumer_key=consumer_key,
             consumer_secret=consumer_secret,
@@ -35,106 +91,84 @@ class USOSAPISession:
             request_token_url=base_address + _REQUEST_TOKEN_SUFFIX,
             authorize_url=base_address + _AUTHORIZE_SUFFIX,
             access_token_url=base_address + _ACCESS_TOKEN_SUFFIX,
-            base_url=base_address
+            base_url=base_address,
+            session_obj=self._make_session
         )
 
-        self.auth_sessions = {}
-        self.auth_sessions_lock = threading.Lock()
+        self.token_store = token_store if token_store is not None else MemoryTokenStore()
+
+    def _make_session(self, *args, **kwargs):
+        session = rauth.OAuth1Session(*args, **kwargs)
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        return session
+
+    def _observe(self, operation, started_at, failed):
+        if self.observer is not None:
+            self.observer(operation, time.perf_counter() - started_at, failed)
+
+    def post(self, session, service, params):
+        started_at = time.perf_counter()
+        try:
+            response = session.post(service, params=params, data={}, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._observe(service, started_at, True)
+            raise USOSAPIConnectionError(f'Error connecting to USOSAPI: {e}')
+
+        self._observe(service, started_at, not response.ok)
+        if not response.ok:
+            response.raise_for_status()
 
-        self.authorized_session = None
-        self.authorized_session_lock = threading.Lock()
+        return response.json()
 
     def get_auth_url(self, callback='oob'):
         params = {'oauth_callback': callback, 'scopes': self.scopes}
-        token_tuple = self.service.get_request_token(params=params)
+        started_at = time.perf_counter()
+        try:
+            token_tuple = self.service.get_request_token(params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._observe(_REQUEST_TOKEN_SUFFIX, started_at, True)
+            raise USOSAPIConnectionError(f'Error connecting to USOSAPI: {e}')
+        self._observe(_REQUEST_TOKEN_SUFFIX, started_at, False)
         request_token, request_token_secret = token_tuple
 
-        with self.auth_sessions_lock:
-            self.auth_sessions[request_token] = {'secret': request_token_secret, 'timestamp': time.time()}
+        self.token_store.put(request_token, request_token_secret)
 
         return request_token, self.service.get_authorize_url(request_token)
 
     def authorize(self, request_token, pin):
-        try:
-            with self.auth_sessions_lock:
-                request_token_secret = self.auth_sessions.pop(request_token)['secret']
-        except KeyError:
+        request_token_secret = self.token_store.pop(request_token)
+        if request_token_secret is None:
             raise USOSAPIAuthorizationError('Invalid request token')
 
+        started_at = time.perf_counter()
         try:
-            with self.authorized_session_lock:
-                self.authorized_session = self.service.get_auth_session(
-                    request_token,
-                    request_token_secret,
-                    params={'oauth_verifier': pin}
-                )
+            session = self.service.get_auth_session(
+                request_token,
+                request_token_secret,
+                params={'oauth_verifier': pin},
+                timeout=self.timeout
+            )
         except KeyError:
+            self._observe(_ACCESS_TOKEN_SUFFIX, started_at, True)
             raise USOSAPIAuthorizationError('Consumer key or token key does not match')
+        except requests.RequestException as e:
+            self._observe(_ACCESS_TOKEN_SUFFIX, started_at, True)
+            raise USOSAPIConnectionError(f'Error connecting to USOSAPI: {e}')
+        self._observe(_ACCESS_TOKEN_SUFFIX, started_at, False)
 
-    def get_access_data(self):
-        with self.authorized_session_lock:
-            return self.authorized_session.access_token, self.authorized_session.access_token_secret
+        return USOSAPIAuthorizedSession(self, session)
 
     def resume_session(self, access_token, access_token_secret):
-        with self.authorized_session_lock:
-            self.authorized_session = self.service.get_session()
-            self.authorized_session.access_token = access_token
-            self.authorized_session.access_token_secret = access_token_secret
+        authorized_session = USOSAPIAuthorizedSession(
+            self,
+            self.service.get_session((access_token, access_token_secret))
+        )
 
-        if not self.is_session_authorized():
+        if not authorized_session.is_session_authorized():
             raise USOSAPIAuthorizationError('Error resuming USOSAPI session')
 
-    def fetch_from_service(self, service, **kwargs):
-        with self.authorized_session_lock:
-            session = self.authorized_session
-            if session is None:
-                raise USOSAPISessionNotAuthorizedError('Trying to fetch data from not authorized USOSAPI session')
-
-            response = session.post(service, params=kwargs, data={})
-
-        if not response.ok:
-            response.raise_for_status()
-
-        return response.json()
+        return authorized_session
 
     def fetch_anonymously_from_service(self, service, **kwargs):
-        session = self.service.get_session()
-        response = session.post(service, params=kwargs, data={})
-
-        if not response.ok:
-            response.raise_for_status()
-
-        return response.json()
-
-    def is_session_authorized(self):
-        if self.authorized_session is None:
-            return False
-
-        try:
-            identity = self.fetch_from_service('services/users/user')
-            return bool(identity['id'])
-        except USOSAPISessionNotAuthorizedError:
-            return False
-
-    def close_session(self):
-        with self.authorized_session_lock:
-            if self.authorized_session is None:
-                return
-
-            self.fetch_from_service('services/oauth/revoke_token')
-            self.authorized_session = None
-
-    def cleanup_auth_sessions(self):
-        expiration_time = 1800
-        current_time = time.time()
-
-        with self.auth_sessions_lock:
-            expired_tokens = [token for token, details in self.auth_sessions.items() if
-                              current_time - details['timestamp'] > expiration_time]
-
-            expired_sessions_count = 0
-            for token in expired_tokens:
-                del self.auth_sessions[token]
-                expired_sessions_count += 1
-
-        logging.info(f"Removed {expired_sessions_count} expired sessions")
+        return self.post(self.service.get_session(), service, kwargs)